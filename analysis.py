@@ -0,0 +1,227 @@
+"""
+the chance each player wins the game from where it stands - worked out exactly, rather than by playing it out
+
+    python analysis.py 5 5 5 5 5 5                              # six players of the same strength, five die each
+    python analysis.py 3 1 2 --measure MathsBot BayesBot RandomBot --games 500
+
+a game is a Markov chain over the die counts: every round exactly one player loses a die, with a chance that
+depends on who holds how many, until one player is left. the chain only ever goes down, so the chance of winning
+from a state is the sum over who loses next of that chance from the state they leave, worked out once per state
+
+a state is a sorted tuple of (kind, die count) pairs, one per player still in - players of the same kind (the same
+bot, or everyone when they are all alike) holding the same die are interchangeable, so their order doesn't matter
+and e.g. six players of five die each have only 461 states between them
+"""
+import argparse
+import itertools
+import logging
+import sys
+
+import players
+from cache import memoize
+from liar import GameRules, Match, setup_logging
+
+
+class LossModel(object):
+    """
+    who loses the next die - each player has a weight from their kind and die count, and loses the round with
+    their share of the weights at the table
+
+    this is an approximation, and a good one: the chance of being caught out depends far more on your own cup (and
+    how good you are) than on who else is at the table. the chain takes one die a round, so a right exact call,
+    which costs everyone else a die, is taken as one die lost between them - see EmpiricalLoss
+    """
+
+    def weight(self, kind, count):
+        raise NotImplementedError
+
+    def losses(self, state):
+        """
+        :return: the chance each player in state loses the round
+        """
+        weights = [self.weight(kind, count) for kind, count in state]
+        total = float(sum(weights))
+        return [w / total for w in weights]
+
+
+class UniformLoss(LossModel):
+    """
+    everyone is as likely to lose a round as anyone else, whatever their die
+    """
+
+    def weight(self, kind, count):
+        return 1.0
+
+    def __eq__(self, other):
+        return isinstance(other, UniformLoss)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(UniformLoss)
+
+
+class TableLoss(LossModel):
+    """
+    a weight for each (kind, die count) - e.g. how often a MathsBot with 2 die loses a round it plays
+    """
+
+    def __init__(self, weights, default=1.0):
+        # weights - dict of (kind, die count) -> weight, anything missing has the default weight
+        self.weights = dict(weights)
+        self.default = default
+        self.key = (frozenset(self.weights.items()), default)
+
+    def weight(self, kind, count):
+        return self.weights.get((kind, count), self.default)
+
+    def __eq__(self, other):
+        return isinstance(other, TableLoss) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class EmpiricalLoss(object):
+    """
+    measures how often players lose a round, by their kind and die count, from a match's events - subscribe it to
+    a Match (or several) and take the model() when they are done
+
+    kinds - dict of player name -> kind, e.g. their class name so that bots of one kind share their counts,
+        players not in it are their own kind
+
+    every round counts as one die lost, as in the chain - when several players lose one (a right exact call), each
+    is counted as losing their share of it
+    """
+
+    def __init__(self, kinds=None):
+        self.kinds = kinds or {}
+        # (kind, die count) -> [rounds played, rounds lost], a round shared between losers counts a share to each
+        self.rounds = {}
+
+    def kind(self, name):
+        return self.kinds.get(name, name)
+
+    def on_events(self, events):
+        die_counts = None
+        for event in events:
+            if event.kind == 'roundstart':
+                die_counts = event.data['die_counts']
+                for name in event.data['order']:
+                    self.rounds.setdefault((self.kind(name), die_counts[name]), [0, 0])[0] += 1
+            elif event.kind == 'reveal' and die_counts is not None:
+                losers = event.data['losers']
+                for name in losers:
+                    self.rounds[self.kind(name), die_counts[name]][1] += 1.0 / len(losers)
+
+    def model(self):
+        """
+        :return: a TableLoss of each (kind, die count)'s loss rate, smoothed (Laplace) so rarely seen ones aren't
+        0 or 1
+        """
+        return TableLoss(dict((key, (lost + 1.0) / (played + 2.0)) for key, (played, lost) in self.rounds.items()),
+                         default=0.5)
+
+
+def make_state(player_die_count, kinds=None):
+    """
+    :param player_die_count: dict (or helpers.RoundState) of player name -> die count
+    :param kinds: dict of player name -> kind, everyone is of kind None by default
+    :return: the state, as a sorted tuple of (kind, die count) for each player still in
+    """
+    kinds = kinds or {}
+    return tuple(sorted((kinds.get(name), count) for name, count in player_die_count.items() if count > 0))
+
+
+@memoize(maxsize=200000)
+def state_chances(model, state):
+    """
+    :return: dict of (kind, die count) -> the chance a player holding it wins from state
+    """
+    if len(state) == 1:
+        return {state[0]: 1.0}
+
+    losses = model.losses(state)
+    chances = dict.fromkeys(state, 0.0)
+    i = 0
+    # interchangeable players are next to each other in the state, so we go through them a group at a time
+    for entry, group in itertools.groupby(state):
+        held = len(list(group))
+        # the chance that one of the group loses
+        p = losses[i] * held
+        kind, count = entry
+        after = state_chances(model, tuple(sorted(state[:i] + ((kind, count - 1),) * (count > 1) +
+                                                  state[i + held:] + (entry,) * (held - 1))))
+        i += held
+        for other in chances:
+            if other != entry:
+                chances[other] += p * after[other]
+        # one of the group moves down a die, the rest stay where they were
+        chances[entry] += p * (after.get((kind, count - 1), 0.0) + (held - 1) * after.get(entry, 0.0)) / held
+    return chances
+
+
+def win_chances(player_die_count, model=None, kinds=None):
+    """
+    the chance each player wins the game from here
+    :param model: a LossModel, UniformLoss by default
+    :param kinds: dict of player name -> kind, for a model whose weights depend on it
+    :return: dict of player name -> chance of winning
+    """
+    model = model or UniformLoss()
+    kinds = kinds or {}
+    chances = state_chances(model, make_state(player_die_count, kinds))
+    return dict((name, chances[kinds.get(name), count] if count > 0 else 0.0)
+                for name, count in player_die_count.items())
+
+
+def measure(rules, lineup, games=200, seed=0):
+    """
+    plays a match between the lineup, and measures its loss model - players of the same class are one kind
+    :param lineup: list of player classes
+    :return: (EmpiricalLoss.model(), kinds)
+    """
+    match = Match(rules, games=games, loglevel=logging.ERROR, seed=seed)
+    kinds = {}
+    for i, player_class in enumerate(lineup):
+        name = '%s%s' % (player_class.__name__, i)
+        kinds[name] = player_class.__name__
+        match.addPlayer(player_class(name))
+    empirical = EmpiricalLoss(kinds)
+    match.subscribe(empirical, ['roundstart', 'reveal'])
+    match.run()
+    return empirical.model(), kinds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='the chance each player wins from their die counts')
+    parser.add_argument('counts', type=int, nargs='+', help='die count of each player')
+    parser.add_argument('--measure', nargs='+', metavar='PLAYER',
+                        help='measure the loss model from a match between these players, one per count')
+    parser.add_argument('--games', type=int, default=200, help='games to measure over')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    setup_logging(logging.WARN)
+
+    if args.measure:
+        if len(args.measure) != len(args.counts):
+            parser.error('one player per count')
+        lineup = [players.get(name) for name in args.measure]
+        model, kinds = measure(GameRules(), lineup, args.games, args.seed)
+        names = ['%s%s' % (player_class.__name__, i) for i, player_class in enumerate(lineup)]
+    else:
+        model, kinds = UniformLoss(), None
+        names = ['player%s' % i for i in range(len(args.counts))]
+
+    chances = win_chances(dict(zip(names, args.counts)), model, kinds)
+    for name, count in zip(names, args.counts):
+        print '%-16s %2s die  %6.2f%%' % (name, count, 100 * chances[name])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+# batch gamemaster - plays many independent games in lockstep, keeping the game state in numpy arrays
+import copy
+import math
+
+import numpy as np
+
+from helpers import Bid
+from helpers import Cup
+from helpers import RoundState
+from helpers import CALL_BID, CALL_LIAR, CALL_EXACT, CALL_INVALID, CALLS
+from liar import Match
+
+# columns of the per-game stats array, in the order of Match.run's stats dicts
+STAT_KEYS = (None, True, False, 'derp')
+NONE, TRUE, FALSE, DERP = range(4)
+
+
+class ScalarBatch(object):
+    """
+    lets a player that only understands get_bid take part in a batch, by giving each game its own copy of the player
+    """
+    allow_retries = False
+
+    def __init__(self, player, games):
+        self.player = player
+        self.allow_retries = player.allow_retries
+        self.clones = [copy.copy(player) for _ in range(games)]
+
+    def new_game(self, players, rules):
+        self.rules = rules
+        self.names = [player.name for player in players]
+        self.index = self.names.index(self.player.name)
+        for clone in self.clones:
+            clone.new_game(players, rules)
+
+    def new_round_batch(self, games, dice, faces, die_counts, seats=None):
+        self.round_games = games
+        names = self.names
+        for row, game in enumerate(games):
+            # players that are out of the game are not told about the round, just like in Match.run
+            if die_counts[row, self.index] > 0:
+                counts = die_counts[row].tolist()
+                order = [names[seat] for seat in seats[row].tolist() if counts[seat]] if seats is not None else None
+                # each copy sees the round as it would under Match, through a RoundState
+                self.clones[game].new_round(Cup([d for d in dice[row].tolist() if d], tuple(faces[row].tolist())),
+                                            RoundState(names, counts, self.rules, order))
+
+    def get_bid_batch(self, rows, has_last, last_q, last_v, value_lock, rng):
+        """
+        what are your bids? the batch equivalent of get_bid, which bots with supports_batch implement too
+        :param rows: rows of the arrays given to new_round_batch that need a bid
+        :param has_last: whether there is a last bid, per row
+        :param last_q: quantity of the last bid, per row
+        :param last_v: value of the last bid, per row
+        :param value_lock: whether the value is locked, per row
+        :param rng: numpy RandomState for this bot
+        :return: (calls, quantities, values) arrays, calls are helpers.CALL_* codes
+        """
+        calls = np.empty(len(rows), dtype=int)
+        q = np.zeros(len(rows), dtype=int)
+        v = np.zeros(len(rows), dtype=int)
+        for i, row in enumerate(rows):
+            lastbid = Bid('bid', int(last_q[i]), int(last_v[i])) if has_last[i] else None
+            bid = self.clones[self.round_games[row]].get_bid(lastbid, value_lock=bool(value_lock[i]))
+            calls[i] = CALLS.index(bid.call) if bid.call in CALLS else CALL_INVALID
+            q[i] = bid.quantity
+            v[i] = bid.value
+        return calls, q, v
+
+
+def evaluate_bids(game_rules, calls, q, v, has_last, last_q, last_v, totals, value_lock):
+    """
+    the batch equivalent of liar.evaluate_bid
+    :return: (outcome, derp) arrays, outcome is one of NONE, TRUE or FALSE
+    """
+    is_bid = calls == CALL_BID
+
+    # raises - the same checks, in the same order, as evaluate_bid
+    general = (v >= last_v) & (q >= last_q) & ((v > last_v) | (q > last_q))
+    if game_rules.wilds_lock:
+        from_wild = ((v == 1) & (q > last_q)) | ((v > 1) & (q >= 2 * last_q + 1))
+        to_wild = q == (last_q + 1) // 2
+        raise_ok = np.where(last_v == 1, from_wild, np.where(v == 1, to_wild, general))
+    else:
+        raise_ok = general
+    raise_ok &= ~(value_lock & (v != last_v))
+    raise_ok |= ~has_last
+
+    # challenges - count the last bid's value (ones count too, if they are wild)
+    sides = game_rules.die_sides
+    rows = np.arange(len(calls))
+    in_range = (last_v >= 1) & (last_v <= sides)
+    count = np.where(in_range, totals[rows, np.clip(last_v, 0, sides)], 0)
+    if game_rules.wilds:
+        count = count + np.where(last_v > 1, totals[:, 1], 0)
+    # Match.run compares against a missing frequency (None) when there are no such die
+    liar_right = (count == 0) | (count < last_q)
+    exact_right = (count > 0) & (count == last_q)
+
+    valid = np.where(is_bid, raise_ok, has_last & ((calls == CALL_LIAR) | (calls == CALL_EXACT) & bool(game_rules.exact)))
+    right = np.where(calls == CALL_EXACT, exact_right, liar_right)
+    outcome = np.where(~valid, FALSE, np.where(is_bid, NONE, np.where(right, TRUE, FALSE)))
+    return outcome, ~valid
+
+
+def next_seat(seat_active, pos):
+    """
+    the position of the next seat, after pos, that is still in the game
+    """
+    n, seats = seat_active.shape
+    candidates = (pos[:, None] + np.arange(1, seats + 1)) % seats
+    rows = np.arange(n)[:, None]
+    first = seat_active[rows, candidates].argmax(axis=1)
+    return candidates[np.arange(n), first]
+
+
+def make_players_first(order, players):
+    """
+    the batch equivalent of liar.make_player_first, for one player per row of a seating order array
+    """
+    key = np.where(order == players[:, None], -1, np.arange(order.shape[1]))
+    return np.take_along_axis(order, np.argsort(key, axis=1, kind='stable'), axis=1)
+
+
+class BatchMatch(Match):
+    """
+    a Match that plays up to batch_size games at a time in lockstep
+
+    bots with supports_batch get every game's state as arrays through new_round_batch and get_bid_batch,
+    other players are given a copy per game and asked for their bids one by one
+
+    it plays by the same rules, but not the same games as Match for the same seed: the die and seating come from one
+    numpy stream for the whole batch, and bots draw from their own numpy streams rather than their Match ones. so a
+    seed repeats BatchMatch's own results, and the results only match Match's in distribution - bench.py's batch
+    section checks that they do
+    """
+
+    def __init__(self, rules, games=3, loglevel=None, seed=None, batch_size=4096):
+        super(BatchMatch, self).__init__(rules, games=games, loglevel=loglevel, seed=seed)
+        self.batch_size = batch_size
+
+    def run(self):
+        self.in_progress = True
+
+        self.player_count = len(self.players)
+        self.bestof_target = int(math.ceil(self.games / float(self.player_count)))
+
+        self.log.warn('MATCH STARTS. %s GAME(S) WITH %s, RULES %s, SEED %s',
+                      self.games, ['%s' % player for player in self.players], self.rules, self.seed)
+
+        if self.rules.bestof:
+            self.log.info('BEST OF %s: NEED %s TO WIN', self.games, self.bestof_target)
+
+        rng = np.random.RandomState(self.seed)
+        # every player gets its own stream, so one player's choices don't change another's
+        player_rngs = [np.random.RandomState(rng.randint(2 ** 31)) for _ in self.players]
+
+        stats = np.zeros((self.player_count, len(STAT_KEYS)), dtype=np.int64)
+        wins = np.zeros(self.player_count, dtype=np.int64)
+        played = 0
+        while played < self.games:
+            batch = min(self.batch_size, self.games - played)
+            game_stats, winners = self.run_batch(batch, rng, player_rngs)
+
+            if self.rules.bestof:
+                # games are independent, so the match ends at the first game that takes someone to the target
+                cumulative = wins + np.cumsum(winners[:, None] == np.arange(self.player_count), axis=0)
+                reached = (cumulative >= self.bestof_target).any(axis=1)
+                if reached.any():
+                    batch = reached.argmax() + 1
+                    game_stats = game_stats[:batch]
+                    winners = winners[:batch]
+
+            stats += game_stats.sum(axis=0)
+            wins += np.bincount(winners, minlength=self.player_count)
+            played += batch
+            self.log.info('PLAYED %s OF %s GAMES', played, self.games)
+
+            if self.rules.bestof and (wins >= self.bestof_target).any():
+                winner = wins.argmax()
+                self.log.warn("MATCH FINISHED - %s WON BEST OF %s WITH %s of %s GAMES",
+                              self.players[winner].name, self.games, wins[winner], played)
+                break
+
+        player_stats = {}
+        for i, player in enumerate(self.players):
+            player_stats[player.name] = dict((key, int(stats[i, col])) for col, key in enumerate(STAT_KEYS))
+            player_stats[player.name]['wins'] = int(wins[i])
+            player_stats[player.name]['losses'] = int(played - wins[i])
+
+        for player in self.players:
+            self.log.warn("%s %s", player.name, player_stats[player.name])
+        self.in_progress = False
+        return player_stats
+
+    def run_batch(self, games, rng, player_rngs):
+        """
+        plays a batch of independent games to completion
+        :return: (stats, winners) - a (games, players, len(STAT_KEYS)) array of counts, and the winner of each game
+        """
+        rules = self.rules
+        sides = rules.die_sides
+        nplayers = self.player_count
+        everyone = np.arange(nplayers)
+
+        batch_players = [player if getattr(player, 'supports_batch', False) else ScalarBatch(player, games)
+                         for player in self.players]
+        for player in batch_players:
+            player.new_game(self.players, rules)
+        allow_retries = np.array([player.allow_retries for player in batch_players], dtype=bool)
+
+        counts = np.full((games, nplayers), rules.starting_die, dtype=int)
+        # start the players in random order
+        order = np.argsort(rng.random_sample((games, nplayers)), axis=1)
+        stats = np.zeros((games, nplayers, len(STAT_KEYS)), dtype=np.int64)
+        winners = np.zeros(games, dtype=int)
+
+        live = np.arange(games)
+        while live.size:
+            # each round we throw the die
+            active = counts[live] > 0
+            done = active.sum(axis=1) <= 1
+            # we have winners!
+            winners[live[done]] = active[done].argmax(axis=1)
+            live = live[~done]
+            if not live.size:
+                break
+
+            n = live.size
+            rows = np.arange(n)
+            die_counts = counts[live]
+            dice = rng.randint(1, sides + 1, size=(n, nplayers, rules.starting_die))
+            dice[np.arange(rules.starting_die) >= die_counts[:, :, None]] = 0
+            faces = (dice[:, :, :, None] == np.arange(sides + 1)).sum(axis=2)
+            faces[:, :, 0] = 0
+            totals = faces.sum(axis=1)
+            seats = order[live]
+            for i, player in enumerate(batch_players):
+                player.new_round_batch(live, dice[:, i], faces[:, i], die_counts, seats)
+
+            seat_active = np.take_along_axis(die_counts, seats, axis=1) > 0
+            pos = seat_active.argmax(axis=1)
+            # apply the value lock if the first player has only one die
+            value_lock = die_counts[rows, seats[rows, pos]] == 1 if rules.value_lock else np.zeros(n, dtype=bool)
+
+            has_last = np.zeros(n, dtype=bool)
+            last_q = np.zeros(n, dtype=int)
+            last_v = np.zeros(n, dtype=int)
+            last_player = np.zeros(n, dtype=int)
+            caller = np.zeros(n, dtype=int)
+            call = np.zeros(n, dtype=int)
+            outcome = np.zeros(n, dtype=int)
+
+            # the rows still bidding in this round
+            bidding = rows
+            while bidding.size:
+                current = seats[bidding, pos[bidding]]
+                calls = np.empty(bidding.size, dtype=int)
+                q = np.empty(bidding.size, dtype=int)
+                v = np.empty(bidding.size, dtype=int)
+                for i in np.unique(current):
+                    mine = current == i
+                    r = bidding[mine]
+                    calls[mine], q[mine], v[mine] = batch_players[i].get_bid_batch(
+                        r, has_last[r], last_q[r], last_v[r], value_lock[r], player_rngs[i])
+
+                result, derp = evaluate_bids(rules, calls, q, v, has_last[bidding], last_q[bidding],
+                                             last_v[bidding], totals[bidding], value_lock[bidding])
+                game = live[bidding]
+                stats[game, current, DERP] += derp
+
+                # some players are allowed as many invalid bid attempts as they like, they keep their turn
+                retry = derp & allow_retries[current]
+                stats[game[~retry], current[~retry], result[~retry]] += 1
+
+                raised = (result == NONE) & ~retry
+                r = bidding[raised]
+                has_last[r] = True
+                last_q[r] = q[raised]
+                last_v[r] = v[raised]
+                last_player[r] = current[raised]
+                pos[r] = next_seat(seat_active[r], pos[r])
+
+                ended = (result != NONE) & ~retry
+                r = bidding[ended]
+                caller[r] = current[ended]
+                call[r] = calls[ended]
+                outcome[r] = result[ended]
+
+                bidding = bidding[~ended]
+
+            # ok we got an outcome for every game!
+            exact = (outcome == TRUE) & (call == CALL_EXACT)
+            # all other players lose a die
+            others = (die_counts[exact] > 0) & (everyone != caller[exact][:, None])
+            counts[live[exact]] -= others
+
+            # either the previous player was lying, or this player got it wrong
+            loser = np.where(outcome == TRUE, last_player, caller)
+            single = ~exact
+            counts[live[single], loser[single]] -= 1
+
+            first = np.where(exact, caller, loser)
+            order[live] = make_players_first(seats, first)
+
+        return stats, winners
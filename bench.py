@@ -0,0 +1,354 @@
+"""
+benchmarks for the engine and the bots, as JSON, optionally gated against a stored baseline
+
+    python bench.py --out bench.json                  # run everything, save the results
+    python bench.py --baseline bench.json             # run again, fail if anything got slower than the tolerance
+    python bench.py --only micro latency --quick      # just some sections, with fewer repeats
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import players
+from helpers import Bid, get_die_freq, get_faces
+from legal import LegalMoves
+from liar import GameRules, Match, evaluate_bid, getdie
+from metrics import MatchMetrics
+from probability import face_probability, gte_table
+from scaling import round_cost
+
+RULE_VARIANTS = {
+    'plain': dict(),
+    'wilds': dict(wilds=True),
+    'wilds_lock': dict(wilds=True, wilds_lock=True),
+    'exact': dict(exact=True),
+    'value_lock': dict(value_lock=True),
+}
+
+LINEUPS = {
+    '2p-maths': [players.MathsBot, players.MathsBot],
+    '2p-bayes-minmax': [players.BayesBot, players.MinMaxBot],
+    '4p-mixed': [players.RandomBot, players.MinMaxBot, players.MathsBot, players.BayesBot],
+    '6p-mixed': [players.RandomBot, players.MinMaxBot, players.MathsBot, players.BayesBot] + [players.MathsBot] * 2,
+    '10p-random': [players.RandomBot] * 9 + [players.MathsBot],
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BOTS = [players.RandomBot, players.MinMaxBot, players.MathsBot, players.BayesBot]
+
+
+def make_match(lineup, rules, games, seed=0, instrument=None):
+    match = Match(rules, games=games, loglevel=logging.ERROR, seed=seed, instrument=instrument)
+    for i, player_class in enumerate(lineup):
+        match.addPlayer(player_class('%s%s' % (player_class.__name__, i)))
+    return match
+
+
+def timed(f, repeat):
+    """
+    :return: the best time per call over repeat calls of f, in seconds
+    """
+    best = float('inf')
+    for i in range(repeat):
+        start = time.time()
+        f()
+        best = min(best, time.time() - start)
+    return best
+
+
+def bench_throughput(quick):
+    results = {}
+    games = 20 if quick else 200
+    for lineup_name, lineup in sorted(LINEUPS.items()):
+        for rules_name, rules in sorted(RULE_VARIANTS.items()):
+            match = make_match(lineup, GameRules(**rules), games)
+            start = time.time()
+            stats = match.run()
+            elapsed = time.time() - start
+            # an invalid bid also counts as a lost call, unless the player gets to try again
+            decisions = sum(stats[p.name][None] + stats[p.name][True] + stats[p.name][False] +
+                            (stats[p.name]['derp'] if p.allow_retries else 0) for p in match.players)
+            key = '%s,%s' % (lineup_name, rules_name)
+            results['throughput.games_per_sec[%s]' % key] = (games / elapsed, 'higher')
+            results['throughput.decisions_per_sec[%s]' % key] = (decisions / elapsed, 'higher')
+    return results
+
+
+def bench_micro(quick):
+    results = {}
+    number = 2000 if quick else 20000
+    repeat = 3 if quick else 5
+    die = getdie(30, 6)
+    faces = get_faces(die, 6)
+    for rules_name, rules in sorted(RULE_VARIANTS.items()):
+        rules = GameRules(**rules)
+        legal_moves = LegalMoves(rules, 30)
+        last = Bid('bid', 4, 3)
+        cases = {
+            'raise': Bid('bid', 5, 3),
+            'liar': Bid('liar'),
+        }
+        for case, bid in sorted(cases.items()):
+            def run():
+                for i in xrange(number):
+                    evaluate_bid(rules, bid, last, faces, False, legal_moves)
+            results['micro.evaluate_bid_us[%s,%s]' % (case, rules_name)] = (timed(run, repeat) / number * 1e6, 'lower')
+
+    def freq():
+        for i in xrange(number):
+            get_die_freq(die, 3)
+    results['micro.get_die_freq_us[30 die]'] = (timed(freq, repeat) / number * 1e6, 'lower')
+
+    def roll():
+        for i in xrange(number):
+            getdie(5, 6)
+    results['micro.getdie_us[5 die]'] = (timed(roll, repeat) / number * 1e6, 'lower')
+
+    # the tables for a big table must still add up - the sum of P(at least q) over q >= 1 is the expected count
+    for total_die, wilds in [(2000, True), (5000, False)]:
+        expected = total_die * face_probability(6, wilds)
+        table = gte_table(total_die, 6, wilds)
+        if abs(sum(table[1:]) - expected) > 1e-6 * expected:
+            raise AssertionError('gte_table(%s, 6, %s) expects %s die, not %s' % (total_die, wilds, expected,
+                                                                                 sum(table[1:])))
+    return results
+
+
+def bench_latency(quick):
+    results = {}
+    rounds = 20 if quick else 200
+    counts = {'me': 5, 'them': 5, 'others': 5}
+    bids = [None] + [Bid('bid', q, v) for q in range(1, 8) for v in range(1, 7)]
+    for rules_name, rules in sorted(RULE_VARIANTS.items()):
+        rules = GameRules(**rules)
+        for bot_class in BOTS:
+            bot = bot_class('me')
+            bot.new_game([bot], rules)
+            # only the get_bid calls are timed, not new_round
+            elapsed = 0
+            for i in range(rounds):
+                bot.new_round(getdie(5, 6), counts)
+                start = time.time()
+                for bid in bids:
+                    bot.get_bid(bid, value_lock=rules.value_lock)
+                elapsed += time.time() - start
+            key = '%s,%s' % (bot_class.__name__, rules_name)
+            results['latency.get_bid_us[%s]' % key] = (elapsed / (rounds * len(bids)) * 1e6, 'lower')
+    return results
+
+
+def memory_status():
+    """
+    :return: (resident set size now, its peak), in KB, for this process alone
+    """
+    # ru_maxrss carries over through fork and exec, so it can be the parent's peak - /proc has this process's own
+    if os.path.exists('/proc/self/status'):
+        status = {}
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                status[key] = value
+        return int(status['VmRSS'].split()[0]), int(status['VmHWM'].split()[0])
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak, peak
+
+
+def measure_memory(lineup_name, games):
+    """
+    plays games with the lineup in this process
+    :return: (how much the peak rss grew past the rss before the match, the peak), in KB
+    """
+    match = make_match(LINEUPS[lineup_name], GameRules(), games)
+    before, _ = memory_status()
+    match.run()
+    _, peak = memory_status()
+    return peak - before, peak
+
+
+def bench_memory(quick):
+    results = {}
+    games = 100 if quick else 2000
+    for lineup_name in ['2p-maths', '6p-mixed']:
+        # a fresh interpreter for each, rather than a fork of this one, so neither this process's heap nor one
+        # measurement's peak hides the next
+        output = subprocess.check_output([sys.executable, os.path.join(HERE, 'bench.py'), '--memory-child',
+                                          lineup_name, str(games)], cwd=HERE)
+        growth, peak = [int(n) for n in output.split()]
+        results['memory.peak_kb[%s,%s games]' % (lineup_name, games)] = (peak, 'lower')
+        results['memory.growth_kb[%s,%s games]' % (lineup_name, games)] = (growth, 'lower')
+    return results
+
+
+# imports a player the way a fresh worker would, and reports how long it took and how many modules it loaded
+STARTUP_SCRIPT = """
+import sys, time
+start = time.time()
+import players
+players.get(%r)
+sys.stdout.write('%%r %%r' %% (time.time() - start, len(sys.modules)))
+"""
+
+
+def bench_startup(quick):
+    results = {}
+    repeat = 5 if quick else 20
+    for name in ['mathsbot', 'randombot', 'minmax', 'bayes']:
+        times = []
+        for i in range(repeat):
+            output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT % name], cwd=HERE)
+            seconds, modules = output.split()
+            times.append(float(seconds))
+        results['startup.cold_import_ms[%s]' % name] = (sorted(times)[len(times) // 2] * 1000, 'lower')
+        results['startup.modules[%s]' % name] = (int(modules), 'lower')
+    return results
+
+
+def bench_instrument(quick):
+    results = {}
+    games = 20 if quick else 200
+    repeat = 3 if quick else 5
+    for lineup_name in ['2p-maths', '10p-random']:
+        lineup = LINEUPS[lineup_name]
+        plain = timed(lambda: make_match(lineup, GameRules(), games).run(), repeat)
+        instrumented = timed(lambda: make_match(lineup, GameRules(), games, instrument=MatchMetrics()).run(), repeat)
+        results['instrument.games_per_sec[%s,off]' % lineup_name] = (games / plain, 'higher')
+        results['instrument.overhead_pct[%s,on]' % lineup_name] = (100 * (instrumented / plain - 1), 'lower')
+    return results
+
+
+def bench_scaling(quick):
+    results = {}
+    tables = [(10, 5), (50, 5), (50, 20)] if quick else [(10, 5), (50, 5), (50, 20), (100, 20), (200, 10)]
+    for seats, starting_die in tables:
+        # the same seed plays the same games both ways, so both are timed over the same rounds
+        for big_table in [True, False]:
+            per_round, rounds = round_cost(players.MathsBot, seats, starting_die, big_table=big_table)
+            key = '%s,%sx%s' % ('big_table' if big_table else 'Match', seats, starting_die)
+            results['scaling.us_per_round[%s]' % key] = (per_round * 1e6, 'lower')
+    return results
+
+
+def differ(hits, total, other_hits, other_total, sigmas=4.0):
+    """
+    :return: True if two rates are further apart than sigmas standard errors, which chance alone will hardly ever do
+    """
+    if not total or not other_total:
+        return False
+    pooled = (hits + other_hits) / float(total + other_total)
+    error = (pooled * (1 - pooled) * (1.0 / total + 1.0 / other_total)) ** 0.5
+    return abs(hits / float(total) - other_hits / float(other_total)) > sigmas * max(error, 1e-12)
+
+
+def bench_batch(quick):
+    """
+    BatchMatch against Match, for speed and for what happens - BatchMatch rolls its own die, so it doesn't play
+    Match's games seed for seed, but each player's wins and right calls must agree with Match's to within chance
+    """
+    from batch import BatchMatch
+    results = {}
+    games = 300 if quick else 2000
+    lineup = [players.RandomBot, players.MinMaxBot, players.MathsBot]
+    for rules_name, rules in sorted(RULE_VARIANTS.items()):
+        stats = {}
+        for match_class in [Match, BatchMatch]:
+            match = match_class(GameRules(**rules), games=games, loglevel=logging.ERROR, seed=0)
+            for i, player_class in enumerate(lineup):
+                match.addPlayer(player_class('%s%s' % (player_class.__name__, i)))
+            start = time.time()
+            stats[match_class] = match.run()
+            elapsed = time.time() - start
+            results['batch.games_per_sec[%s,%s]' % (match_class.__name__, rules_name)] = (games / elapsed, 'higher')
+        for name, expected in sorted(stats[Match].items()):
+            got = stats[BatchMatch][name]
+            for what, hits, total in [('wins', 'wins', ['wins', 'losses']), ('right calls', True, [True, False])]:
+                if differ(got[hits], sum(got[key] for key in total), expected[hits], sum(expected[key] for key in total)):
+                    raise AssertionError('%s %s under %s rules: BatchMatch %s, Match %s' % (
+                        name, what, rules_name, [got[key] for key in total], [expected[key] for key in total]))
+    return results
+
+
+SECTIONS = [
+    ('throughput', bench_throughput),
+    ('micro', bench_micro),
+    ('latency', bench_latency),
+    ('memory', bench_memory),
+    ('startup', bench_startup),
+    ('instrument', bench_instrument),
+    ('scaling', bench_scaling),
+    ('batch', bench_batch),
+]
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of (metric, baseline, now, change) for every metric that got worse by more than tolerance
+    """
+    regressions = []
+    for metric, (value, better) in sorted(results.items()):
+        if metric not in baseline:
+            continue
+        old = baseline[metric][0]
+        if not old:
+            continue
+        change = (value - old) / float(old)
+        if (better == 'higher' and change < -tolerance) or (better == 'lower' and change > tolerance):
+            regressions.append((metric, old, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='liar\'s dice benchmarks')
+    parser.add_argument('--only', nargs='+', choices=[name for name, _ in SECTIONS], help='sections to run')
+    parser.add_argument('--quick', action='store_true', help='fewer games and repeats, for a smoke test')
+    parser.add_argument('--out', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed fractional regression (default 0.1)')
+    parser.add_argument('--memory-child', nargs=2, metavar=('LINEUP', 'GAMES'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.memory_child:
+        # the memory section runs each measurement this way, see bench_memory
+        lineup_name, games = args.memory_child
+        sys.stdout.write('%s %s' % measure_memory(lineup_name, int(games)))
+        return 0
+
+    results = {}
+    for name, section in SECTIONS:
+        if args.only and name not in args.only:
+            continue
+        sys.stderr.write('running %s...\n' % name)
+        results.update(section(args.quick))
+
+    report = {
+        'meta': {'python': platform.python_version(), 'machine': platform.machine(), 'quick': args.quick,
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print output
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, old, new, change in regressions:
+            sys.stderr.write('REGRESSION %s: %.4g -> %.4g (%+.1f%%)\n' % (metric, old, new, change * 100))
+        if regressions:
+            return 1
+        sys.stderr.write('no regressions beyond %.0f%% against %s\n' % (args.tolerance * 100, args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+caches - for probability tables, search results and anything else that is worked out over and over
+
+    @memoize                          # keeps every result
+    def table(n, sides): ...
+
+    @memoize(maxsize=10000)           # keeps the 10000 most recently used
+    def search(state, depth=3): ...
+
+every cache has a name (a memoized function's is module.function) and counts its hits, misses and evictions, see
+stats(). the caches can be saved to disk once warm and loaded again by the next run, and freeze() marks what is
+cached so far as read only - call it before forking workers, and they all share the parent's tables rather than
+each working out their own
+"""
+import functools
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# name -> cache, for stats, save, load and freeze
+CACHES = {}
+
+MISSING = object()
+
+
+class KWARGS(object):
+    """
+    separates a call's positional arguments from its keywords in the key - a class, as it pickles by name and so
+    loads as itself, where a saved object() would load as a copy that no key matches
+    """
+
+
+class LRUCache(object):
+    """
+    a cache that forgets the least recently used entries once it holds more than maxsize, or keeps everything if
+    maxsize is None
+
+    once frozen, the entries so far are only ever read, so their memory can be shared with forked processes - new
+    entries go alongside, and are bounded by maxsize as before. the frozen entries are bounded by maxsize too, so a
+    frozen cache holds at most twice maxsize
+    """
+
+    def __init__(self, maxsize=1024, name=None):
+        # name - register the cache under this name, so it can be saved, loaded and frozen with the rest
+        self.maxsize = maxsize
+        self.data = OrderedDict() if maxsize is not None else {}
+        self.frozen = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.name = name
+        if name is not None:
+            CACHES[name] = self
+
+    def get(self, key, default=None):
+        data = self.data
+        if key in data:
+            self.hits += 1
+            if self.maxsize is None:
+                return data[key]
+            # re-insert, so this is now the most recently used entry
+            value = data[key] = data.pop(key)
+            return value
+        if self.frozen is not None and key in self.frozen:
+            self.hits += 1
+            return self.frozen[key]
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, value):
+        data = self.data
+        if self.maxsize is None:
+            data[key] = value
+            return
+        data.pop(key, None)
+        data[key] = value
+        if len(data) > self.maxsize:
+            data.popitem(last=False)
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self.data or (self.frozen is not None and key in self.frozen)
+
+    def __len__(self):
+        return len(self.data) + (len(self.frozen) if self.frozen is not None else 0)
+
+    def items(self):
+        """
+        every entry, frozen ones first, least recently used first
+        """
+        items = list(self.frozen.items()) if self.frozen is not None else []
+        return items + list(self.data.items())
+
+    def update(self, items):
+        for key, value in items:
+            self[key] = value
+
+    def freeze(self):
+        """
+        keeps the maxsize most recently used entries so far as they are - they are never moved or evicted until the
+        next freeze, which replaces them
+
+        an unbounded cache is left as it is, it never moves or evicts its entries anyway
+        """
+        if self.maxsize is None:
+            return
+        self.frozen = dict(self.items()[-self.maxsize:]) if self.maxsize else None
+        self.data = OrderedDict()
+
+    def clear(self):
+        self.data.clear()
+        self.frozen = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+        }
+
+
+def make_key(args, kwargs):
+    if not kwargs:
+        return args
+    return args + (KWARGS,) + tuple(sorted(kwargs.items()))
+
+
+class Memoized(object):
+    """
+    a function with its results cached, see memoize
+    """
+
+    def __init__(self, f, maxsize=None, name=None):
+        self.f = f
+        self.cache = LRUCache(maxsize, name or '%s.%s' % (f.__module__, f.__name__))
+        functools.update_wrapper(self, f)
+
+    def __call__(self, *args, **kwargs):
+        key = make_key(args, kwargs) if kwargs else args
+        cache = self.cache
+        if cache.maxsize is None:
+            # the common case, a plain dict lookup without going through get
+            try:
+                value = cache.data[key]
+                cache.hits += 1
+                return value
+            except KeyError:
+                pass
+        value = cache.get(key, MISSING)
+        if value is MISSING:
+            value = cache[key] = self.f(*args, **kwargs)
+        return value
+
+    def __get__(self, instance, owner):
+        # so it can decorate methods too, with the instance as part of the key
+        if instance is None:
+            return self
+        return functools.partial(self, instance)
+
+
+def memoize(f=None, maxsize=None, name=None):
+    """
+    Memoisation decorator for functions taking one or more (hashable) arguments, positional or keyword.
+    maxsize - keep only the most recently used results, e.g. @memoize(maxsize=10000), otherwise keep them all
+    name - what to call the cache, module.function by default
+    """
+    if f is None:
+        return lambda f: Memoized(f, maxsize, name)
+    return Memoized(f, maxsize, name)
+
+
+def stats():
+    """
+    :return: dict of cache name -> its LRUCache.stats()
+    """
+    return dict((name, cache.stats()) for name, cache in CACHES.items())
+
+
+def save(path, names=None):
+    """
+    writes the caches (or just those named) to path - their keys and values must pickle
+    """
+    caches = dict((name, cache.items()) for name, cache in CACHES.items() if names is None or name in names)
+    with open(path, 'wb') as f:
+        pickle.dump(caches, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load(path):
+    """
+    fills the caches from a file written by save - caches that don't exist (yet) in this process are skipped
+    :return: the names of the caches loaded
+    """
+    with open(path, 'rb') as f:
+        caches = pickle.load(f)
+    loaded = []
+    for name, items in caches.items():
+        cache = CACHES.get(name)
+        if cache is not None:
+            cache.update(items)
+            loaded.append(name)
+    return loaded
+
+
+def freeze():
+    """
+    freezes every cache (see LRUCache.freeze), e.g. before starting a pool of workers
+    """
+    for cache in CACHES.values():
+        cache.freeze()
@@ -0,0 +1,323 @@
+"""
+counterfactual regret minimisation - an approximate equilibrium for one round of liar's dice between two players
+
+    python cfr.py --max-die 3 --out cfr.npz                              # solve every 1v1...3v3 round
+    python cfr.py --max-die 2 --wilds --exact --out cfr-wilds.npz        # under other rules
+
+the round is solved rather than the game - a round is won by whoever doesn't lose a die, so each (opener's die,
+other's die) pair is its own zero-sum game, and players.CFRBot plays whichever one it is in
+
+an information set is (seat, cup, last bid) - the player's own die and the bid they have to answer. the bids before
+that are forgotten (imperfect recall), as raises only go up the last bid carries most of the history, and it keeps
+the table to cups * bids * actions per seat
+"""
+import argparse
+import itertools
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+
+from helpers import Bid
+from helpers import get_faces
+from legal import LegalMoves
+from liar import GameRules, evaluate_bid
+
+RULE_FLAGS = ('exact', 'wilds', 'wilds_lock', 'value_lock')
+
+
+def make_cups(count, die_sides):
+    """
+    every cup of count die, as sorted tuples, in a fixed order
+    """
+    return list(itertools.combinations_with_replacement(range(1, die_sides + 1), count))
+
+
+def rules_key(rules):
+    return [rules.die_sides] + [int(bool(getattr(rules, name))) for name in RULE_FLAGS]
+
+
+class RoundGame(object):
+    """
+    the game tree of one round, with the opener (seat 0) holding first_die die and seat 1 holding second_die
+
+    actions are the raises (quantity 1...all the die, in code order), then liar, then exact. bids are numbered
+    by last - 0 before anyone has bid, and i + 1 after raise i
+    """
+
+    def __init__(self, rules, first_die, second_die):
+        self.rules = rules
+        self.die = (first_die, second_die)
+        self.max_quantity = first_die + second_die
+        sides = rules.die_sides
+        self.bids = [Bid('bid', q, v) for q in range(1, self.max_quantity + 1) for v in range(1, sides + 1)]
+        self.bid_index = dict((bid.code, i) for i, bid in enumerate(self.bids))
+        self.liar = len(self.bids)
+        self.exact = self.liar + 1
+        self.actions = self.exact + 1
+        # the value lock is decided by the opener's die, so it holds for the whole round
+        self.value_lock = bool(rules.value_lock and first_die == 1)
+
+        legal_moves = LegalMoves(rules, self.max_quantity)
+        self.legal = []
+        for last in [None] + self.bids:
+            actions = [self.bid_index[bid.code]
+                       for bid in legal_moves.legal_raises(last, self.value_lock, self.max_quantity)]
+            if last is not None:
+                actions.append(self.liar)
+                if rules.exact:
+                    actions.append(self.exact)
+            self.legal.append(np.array(sorted(actions)))
+
+        self.cups = [make_cups(n, sides) for n in self.die]
+        self.cup_index = [dict((cup, i) for i, cup in enumerate(cups)) for cups in self.cups]
+        self.cup_faces = [[get_faces(cup, sides) for cup in cups] for cups in self.cups]
+        self.shapes = [(len(cups), len(self.bids) + 1, self.actions) for cups in self.cups]
+        # (cup, cup, last, action) -> +1 if the call was right, -1 if not
+        self.payoffs = {}
+
+    def action_bid(self, action):
+        if action == self.liar:
+            return Bid('liar')
+        if action == self.exact:
+            return Bid('exact')
+        return self.bids[action]
+
+    def payoff(self, cups, last, action):
+        """
+        what the player making a call wins, +1 for the round or -1
+        """
+        key = cups + (last, action)
+        if key not in self.payoffs:
+            faces = [a + b for a, b in zip(self.cup_faces[0][cups[0]], self.cup_faces[1][cups[1]])]
+            outcome = evaluate_bid(self.rules, self.action_bid(action), self.bids[last - 1], faces, self.value_lock)
+            self.payoffs[key] = 1 if outcome else -1
+        return self.payoffs[key]
+
+    def deal(self, seat, rng):
+        sides = self.rules.die_sides
+        return self.cup_index[seat][tuple(sorted(rng.randint(1, sides) for i in range(self.die[seat])))]
+
+
+class RoundSolver(object):
+    """
+    outcome sampling Monte Carlo CFR (Lanctot et al. 2009) for one RoundGame - each iteration deals the die and
+    walks one path through the bids, updating the regrets of one player and the average strategy of the other
+
+    the regrets are plain lists per information set, over its legal actions only - at a handful of actions
+    a python loop is quicker than numpy
+    """
+
+    def __init__(self, game, exploration=0.6, seed=0):
+        self.game = game
+        self.exploration = exploration
+        self.random = random.Random(seed)
+        self.legal = [legal.tolist() for legal in game.legal]
+        # regret[seat][cup][last], strategy_sum likewise - made when first visited
+        self.regret = [[[None] * len(self.legal) for cup in cups] for cups in game.cups]
+        self.strategy_sum = [[[None] * len(self.legal) for cup in cups] for cups in game.cups]
+        self.iterations = 0
+
+    def solve(self, iterations):
+        game = self.game
+        for i in xrange(iterations):
+            cups = (game.deal(0, self.random), game.deal(1, self.random))
+            self.walk(self.iterations % 2, cups, 0, 0, 1.0, 1.0)
+            self.iterations += 1
+
+    def walk(self, player, cups, seat, last, other_reach, sample):
+        """
+        :param player: the seat whose regrets are updated this iteration
+        :param other_reach: the opponent's probability of reaching here
+        :param sample: the probability of sampling the path so far
+        :return: (sampled utility for player, player's probability of the rest of the path)
+        """
+        game = self.game
+        legal = self.legal[last]
+        n = len(legal)
+        regrets = self.regret[seat][cups[seat]]
+        regret = regrets[last]
+        if regret is None:
+            regret = regrets[last] = [0.0] * n
+
+        positive = [r if r > 0 else 0.0 for r in regret]
+        total = sum(positive)
+        if total > 0:
+            sigma = [r / total for r in positive]
+        else:
+            sigma = [1.0 / n] * n
+        if seat == player:
+            explore = [self.exploration / n + (1 - self.exploration) * p for p in sigma]
+        else:
+            explore = sigma
+
+        r = self.random.random()
+        i = 0
+        while i < n - 1 and r >= explore[i]:
+            r -= explore[i]
+            i += 1
+        action = legal[i]
+
+        if action >= game.liar:
+            utility = game.payoff(cups, last, action)
+            utility = (utility if seat == player else -utility) / (sample * explore[i])
+            tail = 1.0
+        elif seat == player:
+            utility, tail = self.walk(player, cups, 1 - seat, action + 1, other_reach, sample * explore[i])
+        else:
+            utility, tail = self.walk(player, cups, 1 - seat, action + 1, other_reach * sigma[i],
+                                      sample * explore[i])
+
+        if seat == player:
+            w = utility * other_reach * tail
+            for j in range(n):
+                regret[j] -= w * sigma[i]
+            regret[i] += w
+        else:
+            sums = self.strategy_sum[seat][cups[seat]]
+            if sums[last] is None:
+                sums[last] = [0.0] * n
+            weight = other_reach / sample
+            strategy_sum = sums[last]
+            for j in range(n):
+                strategy_sum[j] += weight * sigma[j]
+        return utility, tail * sigma[i]
+
+    def average_strategy(self, seat):
+        """
+        the average strategy of seat, the one that converges to an equilibrium - (cups, bids + 1, actions), zero for
+        illegal actions and uniform over the legal ones where nothing was learned
+        """
+        game = self.game
+        strategy = np.zeros(game.shapes[seat])
+        for cup, sums in enumerate(self.strategy_sum[seat]):
+            for last, legal in enumerate(game.legal):
+                total = sum(sums[last]) if sums[last] is not None else 0
+                if total > 0:
+                    strategy[cup, last, legal] = np.array(sums[last]) / total
+                else:
+                    strategy[cup, last, legal] = 1.0 / len(legal)
+        return strategy
+
+
+def solve_round(job):
+    """
+    :param job: (rules, first die, second die, iterations, exploration, seed)
+    :return: ((first die, second die), (seat 0 strategy, seat 1 strategy), seconds taken)
+    """
+    rules, first_die, second_die, iterations, exploration, seed = job
+    start = time.time()
+    solver = RoundSolver(RoundGame(rules, first_die, second_die), exploration, seed)
+    solver.solve(iterations)
+    return (first_die, second_die), (solver.average_strategy(0), solver.average_strategy(1)), time.time() - start
+
+
+def solve(rules, max_die=3, iterations=500000, exploration=0.6, seed=0, workers=1, log=None):
+    """
+    solves every round from 1 v 1 to max_die v max_die, each round in its own worker if there are several
+    :return: dict of (first die, second die) -> (seat 0 strategy, seat 1 strategy)
+    """
+    jobs = [(rules, first_die, second_die, iterations, exploration, seed)
+            for first_die in range(1, max_die + 1) for second_die in range(1, max_die + 1)]
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        solved = pool.imap_unordered(solve_round, jobs)
+    else:
+        pool = None
+        solved = (solve_round(job) for job in jobs)
+
+    strategies = {}
+    try:
+        for die, seats, seconds in solved:
+            strategies[die] = seats
+            if log:
+                log('solved %s v %s die in %.1fs\n' % (die[0], die[1], seconds))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return strategies
+
+
+def save_strategies(path, rules, strategies):
+    """
+    saves the strategies as float16 - plenty for sampling a move from
+    """
+    arrays = {'rules': np.array(rules_key(rules))}
+    for (first_die, second_die), seats in strategies.items():
+        for seat, strategy in enumerate(seats):
+            arrays['strategy_%s_%s_%s' % (first_die, second_die, seat)] = strategy.astype(np.float16)
+    np.savez_compressed(path, **arrays)
+
+
+class StrategyTable(object):
+    """
+    a saved solution, ready to play from - every decision is a couple of dict lookups and a search of one row
+    """
+
+    def __init__(self, path):
+        data = np.load(path)
+        key = data['rules'].tolist()
+        self.rules = GameRules(die_sides=key[0], **dict(zip(RULE_FLAGS, (bool(k) for k in key[1:]))))
+        self.key = key
+        self.games = {}
+        self.cumulative = {}
+        for name in data.files:
+            if not name.startswith('strategy_'):
+                continue
+            first_die, second_die, seat = (int(n) for n in name.split('_')[1:])
+            if (first_die, second_die) not in self.games:
+                self.games[first_die, second_die] = RoundGame(self.rules, first_die, second_die)
+                self.cumulative[first_die, second_die] = [None, None]
+            self.cumulative[first_die, second_die][seat] = np.cumsum(data[name].astype(np.float32), axis=-1)
+
+    def matches(self, rules):
+        return rules_key(rules) == self.key
+
+    def choose(self, first_die, second_die, seat, cup, lastbid, rng):
+        """
+        :param cup: sorted tuple of the player's die
+        :param rng: a random.Random
+        :return: a Bid sampled from the strategy, or None if the position isn't in the table
+        """
+        game = self.games.get((first_die, second_die))
+        if game is None:
+            return None
+        cup = game.cup_index[seat].get(cup)
+        if lastbid is None:
+            last = 0
+        else:
+            last = game.bid_index.get(lastbid.code, -1) + 1
+        if cup is None or last == 0 and lastbid is not None:
+            return None
+        row = self.cumulative[first_die, second_die][seat][cup, last]
+        action = min(int(np.searchsorted(row, rng.random() * row[-1], side='right')), game.actions - 1)
+        return game.action_bid(action)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='solve liar\'s dice rounds between two players with MCCFR')
+    parser.add_argument('--max-die', type=int, default=3, help='solve every round up to this many die each')
+    parser.add_argument('--iterations', type=int, default=500000, help='iterations for each round')
+    parser.add_argument('--sides', type=int, default=6)
+    parser.add_argument('--exact', action='store_true')
+    parser.add_argument('--wilds', action='store_true')
+    parser.add_argument('--wilds-lock', action='store_true')
+    parser.add_argument('--value-lock', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='rounds solved at once')
+    parser.add_argument('--out', default='cfr.npz')
+    args = parser.parse_args(argv)
+
+    rules = GameRules(die_sides=args.sides, exact=args.exact, wilds=args.wilds, wilds_lock=args.wilds_lock,
+                      value_lock=args.value_lock)
+    strategies = solve(rules, args.max_die, args.iterations, seed=args.seed, workers=args.workers,
+                       log=sys.stderr.write)
+    save_strategies(args.out, rules, strategies)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+self-play datasets - every decision of many games, as rows of numbers ready to train a bot on
+
+    python dataset.py --out selfplay --games 100000 --players MathsBot BayesBot MinMaxBot --workers 4
+
+each row is one decision: the player's own die (as face counts), the die counts, the bid they had to answer, what they
+did, and how it turned out - whether they lost a die that round, and whether they went on to win the game. COLUMNS
+names them, and the face counts follow as faces_1...faces_<die sides>
+
+the games are split into jobs across a process pool. each job fills a fixed size buffer and writes it out as a
+shard whenever it is full, so memory stays the same however many games are played. the shards are .npy files, so
+Dataset can memory map them rather than read them in
+"""
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+
+import numpy as np
+
+import players
+from helpers import CALL_BID, CALL_LIAR, CALL_EXACT, CALL_INVALID
+from helpers import EXACT, LIAR
+from liar import GameRules, Match, setup_logging
+
+COLUMNS = ('job', 'game', 'round', 'seat', 'players', 'die', 'total_die', 'last_quantity', 'last_value',
+           'value_lock', 'call', 'quantity', 'value', 'lost_die', 'won_game')
+DTYPE = np.int32
+
+CALL_COLUMN = {LIAR: CALL_LIAR, EXACT: CALL_EXACT}
+
+
+def columns(rules):
+    return list(COLUMNS) + ['faces_%s' % v for v in range(1, rules.die_sides + 1)]
+
+
+def bid_number(n):
+    # a player can bid anything, we only store what fits
+    try:
+        return int(n)
+    except (TypeError, ValueError):
+        return 0
+
+
+class DatasetRecorder(object):
+    """
+    turns a match's events into rows - subscribe it to a Match, and close it when the match is done
+
+    a round's decisions are held until its reveal, when everyone's die are known, and a game's rows until its end,
+    when the winner is known. then they go into the buffer, which is written out as a shard each time it fills
+    """
+
+    def __init__(self, out, rules, job=0, shard_rows=1 << 16):
+        self.out = out
+        self.rules = rules
+        self.job = job
+        self.width = len(columns(rules))
+        self.buffer = np.zeros((shard_rows, self.width), dtype=DTYPE)
+        self.filled = 0
+        self.shards = []
+        self.rows = 0
+
+        self.seating = None
+        self.game_rows = []
+        self.round = 0
+        self.round_start = None
+        self.decisions = []
+        self.lastbid = None
+        # the last invalid bid, which the challenge ending its round (if it did) is about too
+        self.invalid = None
+
+    def on_events(self, events):
+        for event in events:
+            data = event.data
+            if event.kind == 'gamestart':
+                self.seating = dict((name, seat) for seat, name in enumerate(data['seating']))
+                self.game_rows = []
+                self.round = 0
+            elif event.kind == 'roundstart':
+                self.round_start = data
+                self.decisions = []
+                self.lastbid = None
+                self.invalid = None
+            elif event.kind == 'bid':
+                self.decisions.append((event.player, self.lastbid, data['bid'], False))
+                self.lastbid = data['bid']
+            elif event.kind == 'invalid':
+                self.decisions.append((event.player, self.lastbid, data['bid'], True))
+                self.invalid = data['bid']
+            elif event.kind == 'challenge':
+                # an invalid bid that ended the round has its own event already
+                if data['bid'] is not self.invalid:
+                    self.decisions.append((event.player, data['last_bid'], data['bid'], False))
+            elif event.kind == 'reveal':
+                self.end_round(data['die'], data['losers'])
+            elif event.kind == 'gameend':
+                self.end_game(event.game, data['winner'])
+
+    def end_round(self, die, losers):
+        start = self.round_start
+        die_counts = start['die_counts']
+        total = sum(die_counts.values())
+        sides = self.rules.die_sides
+        for name, lastbid, bid, invalid in self.decisions:
+            faces = [0] * sides
+            for value in die[name]:
+                faces[value - 1] += 1
+            if invalid:
+                call, quantity, value = CALL_INVALID, 0, 0
+            elif bid.code >= 0:
+                call, quantity, value = CALL_BID, bid_number(bid.quantity), bid_number(bid.value)
+            else:
+                call, quantity, value = CALL_COLUMN.get(bid.code, CALL_INVALID), 0, 0
+            if lastbid is None:
+                last_quantity = last_value = 0
+            else:
+                last_quantity, last_value = bid_number(lastbid.quantity), bid_number(lastbid.value)
+            # job and game, and won_game, are filled in at the end of the game
+            self.game_rows.append((name, [0, 0, self.round, self.seating[name], len(start['order']),
+                                          die_counts[name], total, last_quantity, last_value,
+                                          int(start['value_lock']), call, quantity, value, int(name in losers),
+                                          0] + faces))
+        self.round += 1
+
+    def end_game(self, game, winner):
+        won = COLUMNS.index('won_game')
+        for name, row in self.game_rows:
+            row[0] = self.job
+            row[1] = game
+            row[won] = int(name == winner)
+            if self.filled == len(self.buffer):
+                self.flush()
+            self.buffer[self.filled] = row
+            self.filled += 1
+        self.game_rows = []
+
+    def flush(self):
+        if not self.filled:
+            return
+        path = os.path.join(self.out, 'shard-%05d-%04d.npy' % (self.job, len(self.shards)))
+        np.save(path, self.buffer[:self.filled])
+        self.shards.append(os.path.basename(path))
+        self.rows += self.filled
+        self.filled = 0
+
+    def close(self):
+        self.flush()
+
+
+def record_job(job):
+    """
+    plays one job's games in a fresh Match, recording them as shards
+    :param job: (out, rules, lineup, games, seed, job number, shard_rows)
+    :return: (shard file names, rows)
+    """
+    out, rules, lineup, games, seed, number, shard_rows = job
+    match = Match(rules, games=games, loglevel=logging.ERROR, seed=seed)
+    for player_class, name, settings in lineup:
+        match.addPlayer(player_class(name, **settings))
+    recorder = DatasetRecorder(out, rules, number, shard_rows)
+    match.subscribe(recorder)
+    match.run()
+    recorder.close()
+    return recorder.shards, recorder.rows
+
+
+def generate(out, rules, lineup, games, workers=None, job_games=1000, shard_rows=1 << 16, seed=0, log=None):
+    """
+    plays games across a pool of workers, writing their decisions to shards in out, and an index.json naming them
+    :param lineup: (player class, name, settings dict) for each player
+    :return: the number of rows written
+    """
+    workers = workers or multiprocessing.cpu_count()
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    rng = random.Random(seed)
+    jobs = [(out, rules, lineup, min(job_games, games - start), rng.getrandbits(32), number, shard_rows)
+            for number, start in enumerate(range(0, games, job_games))]
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        recorded = pool.imap_unordered(record_job, jobs)
+    else:
+        pool = None
+        recorded = (record_job(job) for job in jobs)
+
+    shards = []
+    rows = 0
+    try:
+        for job_shards, job_rows in recorded:
+            shards.extend(job_shards)
+            rows += job_rows
+            if log:
+                log('%s rows in %s shards\n' % (rows, len(shards)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    index = {
+        'columns': columns(rules),
+        'rules': rules.__dict__,
+        'players': [name for _, name, _ in lineup],
+        'games': games,
+        'rows': rows,
+        'shards': sorted(shards),
+    }
+    with open(os.path.join(out, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    return rows
+
+
+class Dataset(object):
+    """
+    the shards of a dataset, memory mapped - nothing is read until it is used
+
+        data = Dataset('selfplay')
+        for shard in data.shards:
+            features = shard[:, data.columns['faces_1']:]
+    """
+
+    def __init__(self, path):
+        index_path = os.path.join(path, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+            names = self.index['shards']
+        else:
+            # a dataset still being written, or without its index
+            self.index = None
+            names = sorted(os.path.basename(name) for name in glob.glob(os.path.join(path, 'shard-*.npy')))
+        self.shards = [np.load(os.path.join(path, name), mmap_mode='r') for name in names]
+        width = self.shards[0].shape[1] if self.shards else len(COLUMNS)
+        names = self.index['columns'] if self.index else list(COLUMNS) + [
+            'faces_%s' % v for v in range(1, width - len(COLUMNS) + 1)]
+        self.columns = dict((name, i) for i, name in enumerate(names))
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, i):
+        """
+        one row, by its number across all the shards
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        shard = int(np.searchsorted(self.offsets, i, side='right')) - 1
+        return self.shards[shard][i - self.offsets[shard]]
+
+    def column(self, name):
+        """
+        one column across all the shards, read into memory
+        """
+        col = self.columns[name]
+        return np.concatenate([shard[:, col] for shard in self.shards]) if self.shards else np.zeros(0, DTYPE)
+
+    def batches(self, size, rng=None):
+        """
+        rows in batches of size, a shard at a time so only one shard is paged in at once - shuffled within each
+        shard, and the shards in a random order, if rng (a numpy RandomState) is given
+        """
+        order = range(len(self.shards))
+        if rng is not None:
+            rng.shuffle(order)
+        for n in order:
+            shard = self.shards[n]
+            rows = np.arange(len(shard))
+            if rng is not None:
+                rng.shuffle(rows)
+            for start in range(0, len(shard), size):
+                yield shard[np.sort(rows[start:start + size])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='record self-play games as a dataset of decisions')
+    parser.add_argument('--out', required=True, help='directory for the shards')
+    parser.add_argument('--players', nargs='+', default=['MathsBot', 'BayesBot', 'MinMaxBot'],
+                        help='players by name (see players.get)')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--job-games', type=int, default=1000, help='games per job')
+    parser.add_argument('--shard-rows', type=int, default=1 << 16, help='rows per shard')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    lineup = [(players.get(name), '%s%s' % (name, i), {}) for i, name in enumerate(args.players)]
+    generate(args.out, GameRules(), lineup, args.games, args.workers, args.job_games, args.shard_rows, args.seed,
+             log=sys.stderr.write)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
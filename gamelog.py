@@ -0,0 +1,297 @@
+# binary game log - an append-only file of every game played, that can be read back (and replayed) without loading it
+import mmap
+import os
+import struct
+from array import array
+from collections import namedtuple
+
+from helpers import Bid, InvalidBid
+from helpers import get_faces
+from liar import GameRules, evaluate_bid, make_player_first
+
+MAGIC = b'LDGL\x01'
+# every record is a header of (payload length, type) then the payload
+RECORD = struct.Struct('<IB')
+MATCH_RECORD = ord('M')
+GAME_RECORD = ord('G')
+
+RULE_FLAGS = ('exact', 'wilds', 'wilds_lock', 'value_lock', 'bestof')
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+MATCH_HEADER = struct.Struct('<BHHH')  # rule flags, starting_die, die_sides, number of names
+ROUND_END = struct.Struct('<BI')  # value lock, number of bids
+
+# order - names in bidding order, die - name: list of die, bids - integer codes, the last one ends the round
+RoundRecord = namedtuple('RoundRecord', 'order die value_lock bids outcome')
+GameRecord = namedtuple('GameRecord', 'rules names seating rounds winner')
+
+
+class ReplayError(Exception):
+    pass
+
+
+def encode_rules(rules):
+    flags = 0
+    for bit, name in enumerate(RULE_FLAGS):
+        if getattr(rules, name):
+            flags |= 1 << bit
+    return flags
+
+
+def decode_rules(flags, starting_die, die_sides):
+    settings = dict((name, bool(flags & (1 << bit))) for bit, name in enumerate(RULE_FLAGS))
+    return GameRules(starting_die=starting_die, die_sides=die_sides, **settings)
+
+
+class GameLogWriter(object):
+    """
+    appends each game of a match to a game log, through the match's events
+
+        with GameLogWriter('games.ldgl') as log:
+            log.attach(match)
+            match.run()
+
+    records are built in memory and written buffer_size bytes at a time
+    """
+    kinds = ('gamestart', 'roundstart', 'challenge', 'reveal', 'gameend', 'bid')
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.buffer_size = buffer_size
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.buffer = bytearray()
+        self.names = None
+        self.index = {}
+
+    def attach(self, match):
+        match.subscribe(self, self.kinds)
+        self.names = None
+
+    def on_events(self, events):
+        for event in events:
+            getattr(self, 'on_' + event.kind)(event)
+
+    def on_gamestart(self, event):
+        seating = event.data['seating']
+        if self.names is None or set(seating) != set(self.names):
+            # a new match (or new players), the games that follow refer to this list of names
+            self.write_match(event.data['rules'], sorted(seating))
+        self.game = bytearray()
+        self.game += U16.pack(len(seating))
+        for name in seating:
+            self.game += U16.pack(self.index[name])
+        self.rounds = []
+
+    def on_roundstart(self, event):
+        self.round = {'order': event.data['order'], 'value_lock': event.data['value_lock'], 'bids': []}
+        self.rounds.append(self.round)
+
+    def on_bid(self, event):
+        self.round['bids'].append(event.data['bid'].code)
+
+    def on_challenge(self, event):
+        self.round['bids'].append(event.data['bid'].code)
+        self.round['outcome'] = bool(event.data['outcome'])
+
+    def on_reveal(self, event):
+        self.round['die'] = event.data['die']
+
+    def on_gameend(self, event):
+        game = self.game
+        game += U32.pack(len(self.rounds))
+        for r in self.rounds:
+            game += U16.pack(len(r['order']))
+            for name in r['order']:
+                die = r['die'][name]
+                game += U16.pack(self.index[name])
+                game += U16.pack(len(die))
+                game += bytearray(die)
+            game += ROUND_END.pack(r['value_lock'], len(r['bids']))
+            game += array('i', r['bids']).tostring()
+            game += bytearray([r['outcome']])
+        game += U16.pack(self.index[event.data['winner']])
+        self.write_record(GAME_RECORD, game)
+
+    def write_match(self, rules, names):
+        self.names = names
+        self.index = dict((name, i) for i, name in enumerate(names))
+        record = bytearray(MATCH_HEADER.pack(encode_rules(rules), rules.starting_die, rules.die_sides, len(names)))
+        for name in names:
+            encoded = name.encode('utf-8')
+            record += U16.pack(len(encoded))
+            record += encoded
+        self.write_record(MATCH_RECORD, record)
+
+    def write_record(self, kind, payload):
+        self.buffer += RECORD.pack(len(payload), kind)
+        self.buffer += payload
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameLog(object):
+    """
+    reads a game log through mmap - games are only decoded when asked for, by index or by iterating
+
+    opening the log walks the record headers once, keeping one offset (an unsigned long) per game
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a game log' % path)
+
+        # the offset of each game record, and of the match record it belongs to
+        self.games = array('L')
+        self.game_matches = array('L')
+        self.matches = {}
+        pos = len(MAGIC)
+        match = None
+        while pos + RECORD.size <= size:
+            length, kind = RECORD.unpack_from(self.map, pos)
+            if kind == MATCH_RECORD:
+                match = pos
+            elif kind == GAME_RECORD:
+                self.games.append(pos)
+                self.game_matches.append(match)
+            pos += RECORD.size + length
+
+    def __len__(self):
+        return len(self.games)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.games)
+        if not 0 <= i < len(self.games):
+            raise IndexError('game %s not in log' % i)
+        rules, names = self.match(self.game_matches[i])
+        return self.decode_game(self.games[i] + RECORD.size, rules, names)
+
+    def __iter__(self):
+        for i in range(len(self.games)):
+            yield self[i]
+
+    def match(self, offset):
+        if offset not in self.matches:
+            pos = offset + RECORD.size
+            flags, starting_die, die_sides, count = MATCH_HEADER.unpack_from(self.map, pos)
+            pos += MATCH_HEADER.size
+            names = []
+            for i in range(count):
+                length, = U16.unpack_from(self.map, pos)
+                pos += U16.size
+                names.append(self.map[pos:pos + length].decode('utf-8'))
+                pos += length
+            self.matches[offset] = decode_rules(flags, starting_die, die_sides), names
+        return self.matches[offset]
+
+    def decode_game(self, pos, rules, names):
+        m = self.map
+        count, = U16.unpack_from(m, pos)
+        seating = [names[i] for i in struct.unpack_from('<%sH' % count, m, pos + U16.size)]
+        pos += U16.size * (count + 1)
+        rounds_count, = U32.unpack_from(m, pos)
+        pos += U32.size
+        rounds = []
+        for r in range(rounds_count):
+            active, = U16.unpack_from(m, pos)
+            pos += U16.size
+            order = []
+            die = {}
+            for a in range(active):
+                index, ndie = struct.unpack_from('<HH', m, pos)
+                pos += 4
+                order.append(names[index])
+                die[names[index]] = list(bytearray(m[pos:pos + ndie]))
+                pos += ndie
+            value_lock, nbids = ROUND_END.unpack_from(m, pos)
+            pos += ROUND_END.size
+            bids = list(struct.unpack_from('<%si' % nbids, m, pos))
+            pos += 4 * nbids
+            outcome = bool(ord(m[pos:pos + 1]))
+            pos += 1
+            rounds.append(RoundRecord(order, die, bool(value_lock), bids, outcome))
+        winner, = U16.unpack_from(m, pos)
+        return GameRecord(rules, names, seating, rounds, names[winner])
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+
+def replay(game):
+    """
+    re-runs a recorded game through evaluate_bid, checking every round plays out as it was recorded
+    :param game: a GameRecord
+    :return: the winner
+    :raises ReplayError: at the first thing that doesn't match
+    """
+    rules = game.rules
+    seating = list(game.seating)
+    die_counts = dict((name, rules.starting_die) for name in seating)
+
+    for number, r in enumerate(game.rounds):
+        active = [name for name in seating if die_counts[name] > 0]
+        if active != r.order:
+            raise ReplayError('round %s: expected bidding order %s, recorded %s' % (number, active, r.order))
+        for name in active:
+            if len(r.die[name]) != die_counts[name]:
+                raise ReplayError('round %s: %s should have %s die' % (number, name, die_counts[name]))
+        value_lock = die_counts[active[0]] == 1 and rules.value_lock
+        if value_lock != r.value_lock:
+            raise ReplayError('round %s: value lock should be %s' % (number, value_lock))
+
+        faces = get_faces([d for name in active for d in r.die[name]], rules.die_sides)
+        lastbid = None
+        last_player = None
+        outcome = None
+        for turn, code in enumerate(r.bids):
+            player = active[turn % len(active)]
+            bid = Bid.from_code(code)
+            try:
+                outcome = evaluate_bid(rules, bid, lastbid, faces, value_lock)
+            except InvalidBid:
+                outcome = False
+            if turn < len(r.bids) - 1:
+                if outcome is not None:
+                    raise ReplayError('round %s: bid %s (%s) should have ended the round' % (number, turn, bid))
+                lastbid = bid
+                last_player = player
+        if outcome != r.outcome:
+            raise ReplayError('round %s: outcome should be %s, recorded %s' % (number, outcome, r.outcome))
+
+        if outcome and bid.call == 'exact':
+            make_player_first(seating, player)
+            for name in active:
+                if name != player:
+                    die_counts[name] -= 1
+        elif outcome:
+            die_counts[last_player] -= 1
+            make_player_first(seating, last_player)
+        else:
+            die_counts[player] -= 1
+            make_player_first(seating, player)
+
+    active = [name for name in seating if die_counts[name] > 0]
+    if active != [game.winner]:
+        raise ReplayError('expected winner %s, recorded %s' % (active, game.winner))
+    return game.winner
@@ -1,3 +1,11 @@
+import importlib
+import numbers
+from collections import Mapping
+
+# the caches live in their own module, these names are kept for everything that imports them from here
+from cache import LRUCache, memoize
+
+
 def get_die_freq(all_die, ones_as_value=False):
     """
     returns a frequency map of {value: quantity} for the die
@@ -14,34 +22,212 @@ def get_die_freq(all_die, ones_as_value=False):
     return freq
 
 
-def memoize(f):
-    """ Memoisation decorator for functions taking one or more arguments. """
+def get_faces(all_die, die_sides):
+    """
+    returns a histogram of the die, faces[value] is the quantity of that value (faces[0] is always 0)
+    """
+    faces = [0] * (die_sides + 1)
+    for die in all_die:
+        faces[die] += 1
+    return tuple(faces)
+
+
+def count_value(faces, value, wilds=False):
+    """
+    how many die count towards a bid on value, from a histogram
+    wilds - ones count as any other value (as get_die_freq's ones_as_value does)
+    """
+    count = faces[value] if 0 < value < len(faces) else 0
+    if wilds and value > 1:
+        count += faces[1]
+    return count
+
+
+class Cup(list):
+    """
+    a player's die, along with their histogram (see get_faces) so nobody has to count them again
+    """
+
+    def __init__(self, die=(), faces=()):
+        super(Cup, self).__init__(die)
+        self.faces = faces
+
+
+class RoundState(object):
+    """
+    everyone's die count for a round - made once by the GM and shared by every player, so it can't be changed
+
+    it reads like the dict of name: die count it replaces, as well as through names, counts, total, order and rules
+    """
+    __slots__ = ('names', 'counts', 'total', 'order', 'rules', 'index')
+
+    def __init__(self, names, counts, rules, order=None, index=None):
+        # names - everyone in the match, in seating order, counts - their die counts, in the same order
+        # order - the names of the players still in, in bidding order, by default in seating order
+        # index - dict of name: position in names, for a GM that keeps the same names from round to round
+        init = super(RoundState, self).__setattr__
+        init('names', tuple(names))
+        init('counts', tuple(counts))
+        init('total', sum(self.counts))
+        init('order', tuple(order) if order is not None else
+             tuple(name for name, count in zip(self.names, self.counts) if count > 0))
+        init('rules', rules)
+        init('index', index if index is not None else dict((name, i) for i, name in enumerate(self.names)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('the round state is read only')
+
+    def __reduce__(self):
+        return RoundState, (self.names, self.counts, self.rules, self.order)
+
+    def hidden(self, name):
+        """
+        how many die name can't see - everyone else's
+        """
+        return self.total - self.counts[self.index[name]]
+
+    def __getitem__(self, name):
+        return self.counts[self.index[name]]
+
+    def get(self, name, default=None):
+        return self.counts[self.index[name]] if name in self.index else default
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def values(self):
+        return list(self.counts)
+
+    def items(self):
+        return zip(self.names, self.counts)
 
-    class memodict(dict):
-        def __init__(self, f):
-            self.f = f
+    def __eq__(self, other):
+        return isinstance(other, Mapping) and dict(self.items()) == dict(other.items())
 
-        def __call__(self, *args):
-            return self[args]
+    def __ne__(self, other):
+        return not self == other
 
-        def __missing__(self, key):
-            ret = self[key] = self.f(*key)
-            return ret
+    __hash__ = None
 
-    return memodict(f)
+    def __repr__(self):
+        return 'RoundState(%s, total=%s)' % (', '.join('%s=%s' % item for item in self.items()), self.total)
+
+Mapping.register(RoundState)
+
+
+class lazy_import(object):
+    """
+    stands in for a module until something is used from it, and only then imports it
+    numpy = lazy_import('numpy') - for modules that only need numpy now and then, as it is slow to import
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.name), attr)
+
+
+# integer call codes, for engines that keep bids in arrays rather than Bid objects
+CALL_BID = 0
+CALL_LIAR = 1
+CALL_EXACT = 2
+CALL_INVALID = 3
+CALLS = ('bid', 'liar', 'exact')
 
 
 class InvalidBid(Exception):
     pass
 
 
+# bids are encoded as one integer, quantity << VALUE_BITS | value, which orders raises by quantity then value
+# calls are negative sentinels, so 'is this a raise' is just code >= 0
+VALUE_BITS = 8
+VALUE_MASK = (1 << VALUE_BITS) - 1
+LIAR = -1
+EXACT = -2
+INVALID = -3
+CALL_CODES = {'liar': LIAR, 'exact': EXACT}
+CODE_CALLS = {LIAR: 'liar', EXACT: 'exact', INVALID: 'invalid'}
+
+
+def encode_bid(call, quantity=0, value=0):
+    """
+    the integer code for a bid, values must fit in VALUE_BITS
+    anything that isn't a whole quantity of at least one and a value that fits is INVALID, rather than some other bid
+    """
+    if call == 'bid':
+        if (isinstance(quantity, numbers.Integral) and isinstance(value, numbers.Integral)
+                and quantity >= 1 and 0 <= value <= VALUE_MASK):
+            return int(quantity) << VALUE_BITS | int(value)
+        return INVALID
+    return CALL_CODES.get(call, INVALID)
+
+
+def decode_bid(code):
+    """
+    the (call, quantity, value) for an integer code
+    """
+    if code >= 0:
+        return 'bid', code >> VALUE_BITS, code & VALUE_MASK
+    return CODE_CALLS.get(code, 'invalid'), 0, 0
+
+
 class Bid(object):
+    """
+    a bid or call, held as its integer code - read only, quantity and value are worked out from the code so they
+    can't disagree with it
+    """
+    __slots__ = ('code',)
+
     def __init__(self, call='bid', quantity=0, value=0):
-        self.quantity = quantity
-        self.value = value
-        self.call = call
+        super(Bid, self).__setattr__('code', encode_bid(call, quantity, value))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('bids are read only')
+
+    @classmethod
+    def from_code(cls, code):
+        bid = cls.__new__(cls)
+        super(Bid, bid).__setattr__('code', code)
+        return bid
+
+    def __reduce__(self):
+        return Bid, decode_bid(self.code)
+
+    @property
+    def quantity(self):
+        return self.code >> VALUE_BITS if self.code >= 0 else 0
+
+    @property
+    def value(self):
+        return self.code & VALUE_MASK if self.code >= 0 else 0
+
+    @property
+    def call(self):
+        if self.code >= 0:
+            return 'bid'
+        return CODE_CALLS.get(self.code, 'invalid')
+
+    def __eq__(self, other):
+        return isinstance(other, Bid) and self.code == other.code
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.code)
 
     def __str__(self):
-        if self.call != 'bid':
+        if self.code < 0:
             return self.call
         return "%s %s %ss" % (self.call, self.quantity, self.value)
@@ -0,0 +1,241 @@
+"""
+a league - ranks bots, and bot settings, by Elo from head to head matches played across a process pool
+
+    python league.py --entry 'MinMaxBot:liar_chance=0,0.1,0.2' --entry MathsBot --entry BayesBot
+    python league.py --entry 'RandomBot:liar_chance=0,0.2,0.4,0.6' --schedule swiss --rounds 6
+
+every pairing plays blocks of games, and ratings are updated as each block comes back. a pairing stops being
+scheduled once its win rate is clearly away from 50%, so the games go where the order is still in doubt
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import random
+import sys
+from collections import namedtuple
+
+import players
+from liar import GameRules, get_logger, setup_logging
+from tournament import play_shard
+
+
+# two sided 95%
+Z = 1.959963984540054
+ELO_SCALE = 400.0
+
+Entry = namedtuple('Entry', 'name player_class settings')
+
+
+def expand_grid(player_class, grid=None):
+    """
+    one entry for each combination of settings
+    :param grid: dict of setting name -> list of values
+    :return: list of Entry
+    """
+    if not grid:
+        return [Entry(player_class.__name__, player_class, {})]
+    keys = sorted(grid)
+    entries = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        settings = dict(zip(keys, values))
+        name = '%s(%s)' % (player_class.__name__, ','.join('%s=%s' % (key, settings[key]) for key in keys))
+        entries.append(Entry(name, player_class, settings))
+    return entries
+
+
+def wilson_interval(wins, games, z=Z):
+    """
+    the Wilson score interval for a win rate
+    """
+    if not games:
+        return 0.0, 1.0
+    p = wins / float(games)
+    denominator = 1 + z * z / games
+    centre = (p + z * z / (2 * games)) / denominator
+    half = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    return centre - half, centre + half
+
+
+class League(object):
+    """
+    plays entries against each other two at a time, in blocks of block_size games
+
+    schedule - 'round-robin' plays every pairing each round, 'swiss' pairs neighbours in the current ratings
+    max_games - the most games any one pairing will play
+    """
+
+    def __init__(self, rules, entries, schedule='round-robin', rounds=10, block_size=20, max_games=200, min_games=40,
+                 k=16.0, workers=None, seed=0, loglevel=None):
+        # min_games - a pairing plays at least this many games before it can be stopped early
+        names = [entry.name for entry in entries]
+        if len(set(names)) != len(names):
+            raise ValueError('entry names must be unique, got %s' % names)
+        if schedule not in ('round-robin', 'swiss'):
+            raise ValueError('unknown schedule %s' % schedule)
+        self.rules = rules
+        self.entries = entries
+        self.schedule = schedule
+        self.rounds = rounds
+        self.block_size = block_size
+        self.max_games = max_games
+        self.min_games = min_games
+        self.k = k
+        self.workers = workers or multiprocessing.cpu_count()
+        self.random = random.Random(seed)
+
+        self.ratings = [1500.0] * len(entries)
+        # Fisher information about each rating, the confidence interval is +- Z / sqrt(information)
+        self.information = [0.0] * len(entries)
+        self.games = [0] * len(entries)
+        # (i, j) with i < j -> [wins for i, games]
+        self.pairings = dict(((i, j), [0, 0]) for i, j in itertools.combinations(range(len(entries)), 2))
+        self.stopped = set()
+        self.log = get_logger('LEAGUE', loglevel)
+
+    def open(self, pairing):
+        return pairing not in self.stopped and self.pairings[pairing][1] < self.max_games
+
+    def schedule_round(self):
+        """
+        :return: the pairings to play this round
+        """
+        if self.schedule == 'round-robin':
+            return [pairing for pairing in sorted(self.pairings) if self.open(pairing)]
+
+        # swiss - neighbours in the standings, skipping anyone whose pairings are all done
+        order = sorted(range(len(self.entries)), key=lambda i: -self.ratings[i])
+        waiting = list(order)
+        pairings = []
+        while waiting:
+            i = waiting.pop(0)
+            for j in waiting:
+                pairing = (min(i, j), max(i, j))
+                if self.open(pairing):
+                    pairings.append(pairing)
+                    waiting.remove(j)
+                    break
+        return pairings
+
+    def jobs(self, pairings):
+        for i, j in pairings:
+            lineup = [(self.entries[n].player_class, self.entries[n].name, self.entries[n].settings) for n in (i, j)]
+            yield (self.rules, lineup, self.block_size, self.random.getrandbits(32))
+
+    def update(self, i, j, i_won):
+        """
+        one game's Elo update, and the information it gives about both ratings
+        """
+        expected = 1.0 / (1 + 10 ** ((self.ratings[j] - self.ratings[i]) / ELO_SCALE))
+        change = self.k * ((1.0 if i_won else 0.0) - expected)
+        self.ratings[i] += change
+        self.ratings[j] -= change
+        information = (math.log(10) / ELO_SCALE) ** 2 * expected * (1 - expected)
+        self.information[i] += information
+        self.information[j] += information
+        self.games[i] += 1
+        self.games[j] += 1
+
+    def record(self, results):
+        """
+        merges a block's results, then stops any pairing it played that is now settled
+        """
+        if not results:
+            return
+        names = dict((entry.name, n) for n, entry in enumerate(self.entries))
+        touched = set()
+        for result in results:
+            i, j = sorted(names[name] for name in result['stats'])
+            winner = names[result['winner']]
+            self.update(i, j, winner == i)
+            pairing = self.pairings[i, j]
+            pairing[0] += winner == i
+            pairing[1] += 1
+            touched.add((i, j))
+
+        for i, j in sorted(touched):
+            wins, games = self.pairings[i, j]
+            low, high = wilson_interval(wins, games)
+            if games >= self.min_games and (low > 0.5 or high < 0.5):
+                self.stopped.add((i, j))
+                self.log.info('%s v %s settled after %s games, %s won %.0f%% (%.0f%%...%.0f%%)',
+                              self.entries[i].name, self.entries[j].name, games, self.entries[i].name,
+                              100.0 * wins / games, 100 * low, 100 * high)
+
+    def interval(self, n):
+        if not self.information[n]:
+            return float('inf')
+        return Z / math.sqrt(self.information[n])
+
+    def run(self):
+        self.log.warn('LEAGUE STARTS. %s ENTRIES, %s, %s GAME BLOCKS ACROSS %s WORKER(S), RULES %s',
+                      len(self.entries), self.schedule, self.block_size, self.workers, self.rules)
+        pool = multiprocessing.Pool(self.workers) if self.workers > 1 else None
+        try:
+            for number in range(self.rounds):
+                pairings = self.schedule_round()
+                if not pairings:
+                    break
+                jobs = self.jobs(pairings)
+                if pool is not None:
+                    # in order, so the ratings don't depend on which worker finishes first
+                    blocks = pool.imap(play_shard, jobs)
+                else:
+                    blocks = (play_shard(job) for job in jobs)
+                for results in blocks:
+                    self.record(results)
+                self.log.info('round %s: %s pairing(s) played, %s settled', number + 1, len(pairings),
+                              len(self.stopped))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        for name, rating, interval, games in self.standings():
+            self.log.warn('%7.1f +- %5.1f  %5s games  %s', rating, interval, games, name)
+        return self.standings()
+
+    def standings(self):
+        """
+        :return: list of (name, rating, 95% confidence interval, games), best first
+        """
+        return sorted(((entry.name, self.ratings[n], self.interval(n), self.games[n])
+                       for n, entry in enumerate(self.entries)), key=lambda row: -row[1])
+
+
+def parse_entry(text):
+    """
+    player or player:setting=1,2,3;other=0.5, players by name (see players.get)
+    """
+    class_name, _, grid_text = text.partition(':')
+    grid = {}
+    for part in filter(None, grid_text.split(';')):
+        key, _, values = part.partition('=')
+        grid[key] = [json.loads(value) for value in values.split(',')]
+    return expand_grid(players.get(class_name), grid)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='rank bots and their settings by Elo')
+    parser.add_argument('--entry', action='append', required=True,
+                        help="a player class and optional settings grid, e.g. 'MinMaxBot:liar_chance=0,0.1'")
+    parser.add_argument('--schedule', choices=['round-robin', 'swiss'], default='round-robin')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--block-size', type=int, default=20, help='games per block')
+    parser.add_argument('--max-games', type=int, default=200, help='most games for any pairing')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    entries = [entry for text in args.entry for entry in parse_entry(text)]
+    league = League(GameRules(), entries, schedule=args.schedule, rounds=args.rounds, block_size=args.block_size,
+                    max_games=args.max_games, workers=args.workers, seed=args.seed)
+    league.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
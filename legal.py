@@ -0,0 +1,116 @@
+# legal moves - which raises are allowed after a bid, worked out once per set of rules rather than on every bid
+import sys
+
+from helpers import Bid
+from helpers import VALUE_BITS, VALUE_MASK
+
+NO_LIMIT = sys.maxsize
+
+
+class LegalMoves(object):
+    """
+    the legal raises after every bid, under one set of GameRules
+
+    for each last bid (and value lock) we keep a (smallest, largest) quantity for each value, every quantity
+    in between is a legal raise, and None means there is no legal raise to that value
+    """
+
+    def __init__(self, rules, max_quantity=0, eager=True):
+        # max_quantity - build the table for last bids up to this quantity (e.g. all the die in the game) up front,
+        #    anything larger is worked out when first asked for
+        # eager - False works out every last bid's raises when first asked for, for games with so many die that
+        #    most bids never come up
+        self.rules = rules
+        self.max_quantity = max_quantity
+        self.successors = {}
+        if not eager:
+            return
+        for value_lock in (False, True):
+            self.successors[None, value_lock] = self.make_bounds(None, value_lock)
+            for q in range(max_quantity + 1):
+                for v in range(rules.die_sides + 1):
+                    code = q << VALUE_BITS | v
+                    self.successors[code, value_lock] = self.make_bounds(code, value_lock)
+
+    def make_bounds(self, last_code, value_lock):
+        return tuple(self.value_bounds(last_code, v, value_lock) for v in range(self.rules.die_sides + 1))
+
+    def value_bounds(self, last_code, value, value_lock):
+        """
+        the (smallest, largest) legal quantity for a raise to value, or None - the rules of evaluate_bid
+        """
+        if last_code is None:
+            return 0, NO_LIMIT
+        last_q = last_code >> VALUE_BITS
+        last_v = last_code & VALUE_MASK
+
+        if value_lock and value != last_v:
+            return None
+
+        if self.rules.wilds_lock:
+            if last_v == 1:
+                # last value was a wild, so you must continue or double
+                if value == 1:
+                    return last_q + 1, NO_LIMIT
+                if value > 1:
+                    return 2 * last_q + 1, NO_LIMIT
+                return None
+            if value == 1:
+                # changing to a wild, you must halve (rounding up) the quantity
+                halved = (last_q + 1) >> 1
+                return halved, halved
+
+        if value > last_v:
+            return last_q, NO_LIMIT
+        if value == last_v:
+            return last_q + 1, NO_LIMIT
+        return None
+
+    def bounds(self, last_bid, value_lock=False):
+        """
+        the (smallest, largest) quantity, or None, for each value from 0 to die_sides after last_bid
+        """
+        key = (None if last_bid is None else last_bid.code, bool(value_lock))
+        try:
+            return self.successors[key]
+        except KeyError:
+            bounds = self.successors[key] = self.make_bounds(key[0], key[1])
+            return bounds
+
+    def is_legal(self, bid, last_bid, value_lock=False):
+        """
+        whether bid is a legal raise after last_bid
+        """
+        code = bid.code
+        if code < 0:
+            return False
+        value = code & VALUE_MASK
+        bounds = self.bounds(last_bid, value_lock)
+        if value < len(bounds):
+            value_bounds = bounds[value]
+        else:
+            value_bounds = self.value_bounds(None if last_bid is None else last_bid.code, value, value_lock)
+        return value_bounds is not None and value_bounds[0] <= code >> VALUE_BITS <= value_bounds[1]
+
+    def legal_raises(self, last_bid, value_lock=False, max_quantity=None):
+        """
+        all the legal raises after last_bid, in order of value then quantity
+        :param max_quantity: the largest quantity worth bidding, defaults to max_quantity of the table
+        """
+        if max_quantity is None:
+            max_quantity = self.max_quantity
+        bounds = self.bounds(last_bid, value_lock)
+        for value in range(1, self.rules.die_sides + 1):
+            if bounds[value] is None:
+                continue
+            low, high = bounds[value]
+            for quantity in range(max(low, 1), min(high, max_quantity) + 1):
+                yield Bid('bid', quantity, value)
+
+    def min_raises(self, last_bid, value_lock=False):
+        """
+        the smallest legal raise for each value that has one
+        """
+        bounds = self.bounds(last_bid, value_lock)
+        return [Bid('bid', max(bounds[value][0], 1), value)
+                for value in range(1, self.rules.die_sides + 1) if bounds[value] is not None]
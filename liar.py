@@ -1,72 +1,164 @@
 # gamemaster
-import copy
 import math
+import Queue
 import random
 import logging
+import threading
+from collections import namedtuple
 
 from helpers import Bid
 from helpers import InvalidBid
-from helpers import get_die_freq
+from helpers import LIAR, EXACT, INVALID, VALUE_BITS, VALUE_MASK
+from helpers import Cup
+from helpers import RoundState
+from helpers import count_value
+from legal import LegalMoves
+from metrics import clock
+from randomness import MatchRNG
 
 
-def getdie(qty, sides):
-    die = []
-    for i in range(qty):
-        die.append(random.randint(1, sides))
-    return die
+def setup_logging(level=logging.INFO):
+    """
+    send log messages to stderr, once per process - call this from scripts, not from library code
+    """
+    logging.basicConfig(level=level)
+
+
+def get_logger(name, level=None):
+    """
+    the named logger, which is quiet unless the caller sets up logging (see setup_logging)
+    :param level: if given, only what is at least this level is logged, whatever the logger itself is set to -
+        for a match (or tournament...) that is louder or quieter than the rest, without changing the rest
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(handler, logging.NullHandler) for handler in logger.handlers):
+        logger.addHandler(logging.NullHandler())
+    return logger if level is None else LevelLogger(logger, level)
+
+
+class LevelLogger(logging.LoggerAdapter):
+    """
+    a logger with a level of its own, see get_logger
+    """
+
+    def __init__(self, logger, level):
+        logging.LoggerAdapter.__init__(self, logger, {})
+        self.level = level
+
+    def isEnabledFor(self, level):
+        return level >= self.level
+
+    def log(self, level, msg, *args, **kwargs):
+        if level >= self.level:
+            self.logger._log(level, msg, args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
 
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
 
-def evaluate_bid(game_rules, bid, last_bid, all_die, value_locked=False):
+    warn = warning
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+def getdie(qty, sides, stream=None):
+    # stream - a randomness.DiceStream to roll from, rather than the global random module
+    if stream is not None:
+        die = stream.roll(qty, sides)
+    else:
+        die = [random.randint(1, sides) for i in range(qty)]
+    # count the faces now, so the round's totals never need the die scanned again
+    faces = [0] * (sides + 1)
+    for value in die:
+        faces[value] += 1
+    return Cup(die, tuple(faces))
+
+
+def evaluate_bid(game_rules, bid, last_bid, faces, value_locked=False, legal_moves=None):
     # we evaluate that the bid is valid
     # and if so, whether it was correct (win or lose)
     # we must take account of the state of '1s', wilds, quantity_locked if player opens bid with only one die
     # win - True, lose - False, continue - None, error - InvalidBid
+    # bids are compared by their integer codes (see helpers.encode_bid)
+    # faces - histogram of all the die on the table (see helpers.get_faces)
+    # legal_moves - a LegalMoves table for game_rules, to look raises up rather than work them out
+
+    code = bid.code
+    if code >= 0 and legal_moves is not None:
+        if legal_moves.is_legal(bid, last_bid, value_locked):
+            return None
+        # work it out the long way, for the reason it is invalid
+        return evaluate_bid(game_rules, bid, last_bid, faces, value_locked)
 
-    if bid.call == 'bid':
+    if code >= 0:
         # otherwise they 'raised' the bid - qty and value have to be greater than the last bid
         if last_bid is None:
             return None
 
-        if value_locked and bid.value != last_bid.value:
-            raise InvalidBid('invalid bid - value is locked and must be %s' % last_bid.value)
+        last_code = last_bid.code
+        value = code & VALUE_MASK
+        last_value = last_code & VALUE_MASK
+        if value_locked and value != last_value:
+            raise InvalidBid('invalid bid - value is locked and must be %s' % last_value)
 
         if game_rules.wilds_lock:
-            if last_bid.value == 1:
+            if last_value == 1:
                 # last value was a wild, so you must continue or double
-                if ((bid.value == 1 and bid.quantity > last_bid.quantity)
-                    or (bid.value > 1 and bid.quantity >= (2 * last_bid.quantity + 1))):
+                if ((value == 1 and code > last_code)
+                    or (value > 1 and code >> VALUE_BITS >= 2 * (last_code >> VALUE_BITS) + 1)):
                     return None
                 else:
                     raise InvalidBid('wilds: you must bid on ones, or double+1 quantity')
 
-            if bid.value == 1 and last_bid.value != 1:
-                # changed to a wild, must have halved the quantity
-                if bid.quantity == int(math.ceil(last_bid.quantity / 2.0)):
+            if value == 1:
+                # changed to a wild, must have halved (rounding up) the quantity
+                if code >> VALUE_BITS == ((last_code >> VALUE_BITS) + 1) >> 1:
                     return None
                 else:
                     raise InvalidBid('wilds: to bid on ones, you must halve quantity')
 
-        if ((bid.value >= last_bid.value)
-            and (bid.quantity >= last_bid.quantity)
-            and ((bid.value > last_bid.value) or (bid.quantity > last_bid.quantity))):
+        # a higher code is a higher quantity, or the same quantity of a higher value
+        if code > last_code and value >= last_value:
             return None
         else:
             raise InvalidBid('qty or val too low')
     else:
+        if code == INVALID:
+            # a raise of no die, a value that doesn't fit, or a call that isn't one
+            raise InvalidBid('not a bid - raises need a quantity of at least 1, and calls are liar or exact')
         # LIAR!
-        # get die frequency
+        # count the die for the last bid
         if last_bid is None:
             raise InvalidBid('cannot call exact or liar as the first bid')
-        freq = get_die_freq(all_die, ones_as_value=(last_bid.value if game_rules.wilds else False))
-        # handle exact and liar calls
-        if bid.call == 'exact' and game_rules.exact:
-            return freq.get(last_bid.value) == last_bid.quantity
-        elif bid.call == 'liar':
-            return freq.get(last_bid.value) < last_bid.quantity
+        count = count_value(faces, last_bid.value, game_rules.wilds)
+        # handle exact and liar calls (no die at all is always a lie, even for a bid of none)
+        if code == EXACT and game_rules.exact:
+            return count != 0 and count == last_bid.quantity
+        elif code == LIAR:
+            return count == 0 or count < last_bid.quantity
         else:
             raise InvalidBid('invalid call type %s' % bid.call)
 
 
+def new_stats():
+    """
+    counts of each bid outcome (None - raised, True - called correctly, False - called wrongly), invalid bids and games
+    """
+    return {None: 0, True: 0, False: 0, 'derp': 0, 'wins': 0, 'losses': 0}
+
+
+def merge_stats(stats, other):
+    for key, count in other.items():
+        stats[key] = stats.get(key, 0) + count
+    return stats
+
+
 def make_player_first(player_list, player):
     player_list.insert(0, player_list.pop(player_list.index(player)))
 
@@ -94,25 +186,156 @@ class GameRules(object):
         return str(self.__dict__)
 
 
+# kind - gamestart, roundstart, bid, invalid, challenge, reveal or gameend
+# player - the name of the player that acted, or None for the GM's own events
+# data - dict of details, which depend on the kind
+GameEvent = namedtuple('GameEvent', 'kind game player data')
+
+# what Match.play yields when it needs a bid from a deferred player
+BidRequest = namedtuple('BidRequest', 'player lastbid value_lock')
+
+
+class EventBus(object):
+    """
+    publishes what happens in a match to its subscribers, a round at a time
+
+    events are buffered and delivered in one batch when the round (or game) ends, so nobody hears about a round
+    while it is being played, and a bus with no subscribers doesn't record anything at all
+    """
+
+    def __init__(self):
+        # (subscriber, set of kinds or None for all of them)
+        self.subscribers = []
+        self.buffer = []
+
+    def subscribe(self, subscriber, kinds=None):
+        """
+        :param subscriber: anything with an on_events(events) method, e.g. a Player or an AsyncSubscriber
+        :param kinds: only deliver these kinds of event
+        """
+        self.subscribers.append((subscriber, frozenset(kinds) if kinds else None))
+
+    def unsubscribe(self, subscriber):
+        self.subscribers = [(s, kinds) for s, kinds in self.subscribers if s is not subscriber]
+
+    def publish(self, kind, game, player=None, **data):
+        if self.subscribers:
+            self.buffer.append(GameEvent(kind, game, player, data))
+
+    def flush(self):
+        if not self.buffer:
+            return
+        events, self.buffer = self.buffer, []
+        for subscriber, kinds in self.subscribers:
+            if kinds is None:
+                subscriber.on_events(events)
+            else:
+                wanted = [event for event in events if event.kind in kinds]
+                if wanted:
+                    subscriber.on_events(wanted)
+
+
+class AsyncSubscriber(object):
+    """
+    hands batches of events to a slow subscriber (a stats writer, a UI) on its own thread, off the game loop
+
+    if the subscriber falls more than maxsize batches behind, new batches are dropped (and counted) rather than
+    holding up the match
+    """
+
+    def __init__(self, subscriber, maxsize=1000):
+        self.subscriber = subscriber
+        self.queue = Queue.Queue(maxsize)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.deliver)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def on_events(self, events):
+        try:
+            self.queue.put_nowait(events)
+        except Queue.Full:
+            self.dropped += len(events)
+
+    def deliver(self):
+        while True:
+            events = self.queue.get()
+            if events is None:
+                break
+            self.subscriber.on_events(events)
+
+    def close(self):
+        """
+        waits for every batch so far to be delivered, then stops the thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+
 class Match(object):
     """
     this does all the work of managing the game, rather like a Game Master (GM)
     """
 
-    def __init__(self, rules, games=3, loglevel=20):
+    def __init__(self, rules, games=3, loglevel=None, seed=None, gamelog=None, instrument=None, keep_results=False,
+                 big_table=False):
+        # seed - matches with the same seed (and players) play out exactly the same
+        # gamelog - path of a binary game log to append every game to (see gamelog.py)
+        # instrument - a metrics.MatchMetrics to time the players and the GM with
+        # keep_results - keep each game's winner and stats in results, run returns the totals either way
+        # big_table - keep the table in a scaling.Table, so that a round with many players and die only costs as
+        #    much as the players still in it - the games are the same either way
         self.rules = rules
         self.games = games
+        self.seed = seed
+        self.gamelog = gamelog
+        self.instrument = instrument
+        self.keep_results = keep_results
+        self.big_table = big_table
         self.players = []
         self.results = []
         self.in_progress = False
-        logging.basicConfig(level=loglevel)
-        self.log = logging.getLogger('GM')
+        self.events = EventBus()
+        # output is the caller's business (see setup_logging), we only pick how much this match says
+        self.log = get_logger('GM', loglevel)
 
     def addPlayer(self, player):
         if not self.in_progress:
             self.players.append(player)
+            if player.observer:
+                self.events.subscribe(player)
+
+    def subscribe(self, subscriber, kinds=None):
+        """
+        hear about the match's events, see EventBus
+        """
+        self.events.subscribe(subscriber, kinds)
 
     def run(self):
+        """
+        plays the whole match, asking deferred players for their bids directly
+        :return: player_stats
+        :raises TypeError: for a deferred player that can't be asked, such as a Remote - play those with Match.play
+        """
+        for player in self.players:
+            if player.deferred and player.get_bid is None:
+                raise TypeError('%s (%s) only bids through Match.play, so this match can\'t be run'
+                                % (player.name, type(player).__name__))
+        play = self.play()
+        try:
+            request = next(play)
+            while True:
+                request = play.send(request.player.get_bid(request.lastbid, value_lock=request.value_lock))
+        except StopIteration:
+            pass
+        return self.player_stats
+
+    def play(self):
+        """
+        plays the match as a generator - bids from deferred players (see Player.deferred) aren't asked for, a
+        BidRequest is yielded instead and the bid is sent back in, so whoever drives it can wait for them however
+        it likes (see server.py)
+        """
         # begin the loops
         # match
         #  games (winner is last one with die)
@@ -123,59 +346,125 @@ class Match(object):
         self.player_count = len(self.players)
         self.bestof_target = int(math.ceil(self.games / float(self.player_count)))
 
+        # the dealer, the die and each player have their own stream, so no one's choices change anyone else's luck
+        self.rng = MatchRNG(self.seed)
+        for seat, player in enumerate(self.players):
+            player.random = self.rng.player(seat)
+
+        # the legal raises are the same for the whole match, and players can use them to check their bids
+        self.legal_moves = LegalMoves(self.rules, max_quantity=self.rules.starting_die * self.player_count,
+                                      eager=not self.big_table)
+
         player_stats = {}
         for player in self.players:
-            player_stats[player.name] = {None: 0, True: 0, False: 0, 'derp': 0, 'wins': 0, 'losses': 0}
+            player_stats[player.name] = new_stats()
+            player.legal_moves = self.legal_moves
 
-        self.log.warn('MATCH STARTS. %s GAME(S) WITH %s, RULES %s' % (
-            self.games, ['%s' % player for player in self.players], self.rules))
+        self.log.warn('MATCH STARTS. %s GAME(S) WITH %s, RULES %s, SEED %s',
+                      self.games, ['%s' % player for player in self.players], self.rules, self.rng.seed)
 
         if self.rules.bestof:
-            self.log.info('BEST OF %s: NEED %s TO WIN' % (self.games, self.bestof_target))
+            self.log.info('BEST OF %s: NEED %s TO WIN', self.games, self.bestof_target)
+
+        if self.gamelog:
+            # imported here, as the game log reads the rules and bids from this module
+            from gamelog import GameLogWriter
+            gamelog = GameLogWriter(self.gamelog)
+            gamelog.attach(self)
+
+        if self.big_table:
+            # imported here too, as scaling builds on this module
+            from scaling import Table
+
+        # debug messages and events are built on every bid, so we only build them when someone will see them
+        debug = self.log.isEnabledFor(logging.DEBUG)
+        events = self.events if self.events.subscribers else None
+        # likewise the timings, everything measured is behind a check of this
+        metrics = self.instrument
+        if metrics is not None:
+            metrics.start(self)
 
         for game in range(self.games):
             self.log.info("GAME STARTED")
 
-            game_stats = {None: 0, True: 0, False: 0, 'derp': 0, 'wins': 0, 'losses': 0}
+            game_stats = new_stats()
+            game_player_stats = {}
             player_die = {}
             player_die_count = {}
 
             for player in self.players:
                 player_die_count[player.name] = self.rules.starting_die
                 player_die[player.name] = []
+                game_player_stats[player.name] = new_stats()
 
             # start the players in random order
-            random.shuffle(self.players)
+            self.rng.dealer.shuffle(self.players)
             for player in self.players:
                 player.new_game(self.players, self.rules)
+            if events:
+                events.publish('gamestart', game, seating=[player.name for player in self.players],
+                               die_counts=dict(player_die_count), rules=self.rules)
+            table = Table(self.players, self.rules.starting_die) if self.big_table else None
 
             while True:
                 # each round we throw the die
-                all_die = []
-                active_players = []
-                for player in self.players:
-                    die_count = player_die_count[player.name]
-                    # is this player out?
-                    if die_count <= 0:
-                        continue
-                    die = getdie(die_count, self.rules.die_sides)
-                    player_die[player.name] = die
-                    # list of all die, for convenience
-                    all_die += die
-                    player.new_round(copy.copy(die), copy.deepcopy(player_die_count))
-                    active_players.append(player)
+                if metrics is not None:
+                    rolled = clock()
+                if table is not None:
+                    active_players, player_cups, faces = table.deal(self.rng.dice, self.rules.die_sides)
+                    if events or debug:
+                        for player, die in zip(active_players, player_cups):
+                            player_die[player.name] = tuple(die)
+                else:
+                    faces = [0] * (self.rules.die_sides + 1)
+                    active_players = []
+                    player_cups = []
+                    for player in self.players:
+                        die_count = player_die_count[player.name]
+                        # is this player out?
+                        if die_count <= 0:
+                            continue
+                        die = getdie(die_count, self.rules.die_sides, self.rng.dice)
+                        # the player gets the cup, we keep a copy they can't change
+                        player_die[player.name] = tuple(die)
+                        # histogram of all die, for the liar and exact calls
+                        faces = [total + count for total, count in zip(faces, die.faces)]
+                        active_players.append(player)
+                        player_cups.append(die)
+                if metrics is not None:
+                    metrics.timed('dice', clock() - rolled)
+
+                # one view of the die counts for everyone, instead of a copy each
+                if table is not None:
+                    state = table.round_state(self.rules)
+                else:
+                    state = RoundState([player.name for player in self.players],
+                                       [player_die_count[player.name] for player in self.players],
+                                       self.rules, [player.name for player in active_players])
+                for player, die in zip(active_players, player_cups):
+                    player.new_round(die, state)
 
                 if len(active_players) <= 1:
                     # we have a winner!
-                    self.log.info("GAME WON BY %s, CONGRATULATIONS!" % active_players[0].name)
-                    player_stats[active_players[0].name]['wins'] += 1
+                    self.log.info("GAME WON BY %s, CONGRATULATIONS!", active_players[0].name)
+                    game_player_stats[active_players[0].name]['wins'] += 1
                     for player in self.players:
                         if player.name != active_players[0].name:
-                            player_stats[player.name]['losses'] += 1
+                            game_player_stats[player.name]['losses'] += 1
+                    if events:
+                        events.publish('gameend', game, winner=active_players[0].name)
+                        events.flush()
+                    if metrics is not None:
+                        metrics.game_end()
                     break
 
                 # apply the value lock if this player has only one die
-                value_lock = player_die_count[active_players[0].name] == 1 and self.rules.value_lock
+                value_lock = state[active_players[0].name] == 1 and self.rules.value_lock
+                if events:
+                    events.publish('roundstart', game, order=[player.name for player in active_players],
+                                   die_counts=dict(state.items()), value_lock=value_lock)
+                if metrics is not None:
+                    round_bids = game_stats[None]
 
                 # within a round, we can go around the 'table' many times (bidding from 1...inf until liar!), so loop players forever
                 lastbid = None
@@ -185,68 +474,122 @@ class Match(object):
                     for player in active_players:
                         # some players are allowed as many invalid bid attempts as they like, so we must loop
                         while True:
-                            bid = player.get_bid(lastbid, value_lock=value_lock)
+                            if metrics is not None:
+                                asked = clock()
+                            if player.deferred:
+                                bid = yield BidRequest(player, lastbid, value_lock)
+                            else:
+                                bid = player.get_bid(lastbid, value_lock=value_lock)
+                            if metrics is not None:
+                                evaluated = clock()
+                                metrics.decision(player.name, evaluated - asked)
                             try:
-                                outcome = evaluate_bid(self.rules, bid, lastbid, all_die, value_lock)
+                                outcome = evaluate_bid(self.rules, bid, lastbid, faces, value_lock, self.legal_moves)
+                                if metrics is not None:
+                                    metrics.timed('evaluate', clock() - evaluated)
                                 break
                             except InvalidBid, e:
-                                self.log.debug('invalid bid, %s, you ought to lose a die for that!' % e)
-                                player_stats[player.name]['derp'] += 1
+                                if metrics is not None:
+                                    metrics.timed('evaluate', clock() - evaluated)
+                                    metrics.derp(player.name)
+                                if debug:
+                                    self.log.debug('invalid bid, %s, you ought to lose a die for that!', e)
+                                if events:
+                                    events.publish('invalid', game, player.name, bid=bid, reason=str(e))
+                                game_player_stats[player.name]['derp'] += 1
                                 game_stats['derp'] += 1
                                 outcome = False
                                 if not player.allow_retries:
                                     break
-                        player_stats[player.name][outcome] += 1
+                        game_player_stats[player.name][outcome] += 1
                         game_stats[outcome] += 1
                         if outcome is None:
                             # bid was raised, so we continue bidding
                             lastbid = bid
                             last_player = player
-                            self.log.debug('%s %s' % (player.name, bid))
+                            if debug:
+                                self.log.debug('%s %s', player.name, bid)
+                            if events:
+                                events.publish('bid', game, player.name, bid=bid)
                             continue
                         else:
                             # player ended this round (we have to reveal the dice and will need another throw)
                             break
                 # ok we got an outcome!
-                self.log.debug(
-                    '%s called %s %s and the die were: %s' % (player.name, last_player.name, bid, sorted(all_die)))
+                if metrics is not None:
+                    metrics.round_end(game_stats[None] - round_bids)
+                if debug:
+                    self.log.debug('%s called %s %s and the die were: %s', player.name,
+                                   last_player.name if last_player else None, bid,
+                                   sorted(d for p in active_players for d in player_die[p.name]))
                 if outcome:
-                    if bid.call == 'exact':
-                        self.log.debug('%s called EXACT and was SPOT ON!' % player.name)
-                        make_player_first(self.players, player)
+                    if bid.code == EXACT:
+                        if debug:
+                            self.log.debug('%s called EXACT and was SPOT ON!', player.name)
                         # all other players lose a die!
-                        for all_other in active_players:
-                            if all_other.name != player.name:
-                                player_die_count[all_other.name] -= 1
+                        losers = [p.name for p in active_players if p.name != player.name]
+                        first = player
                     else:
-                        self.log.debug(
-                            '%s called LIE and was right!, %s is a liar...' % (player.name, last_player.name))
+                        if debug:
+                            self.log.debug('%s called LIE and was right!, %s is a liar...', player.name,
+                                           last_player.name)
                         # previous player was lying!
-                        player_die_count[last_player.name] -= 1
-                        make_player_first(self.players, last_player)
+                        losers = [last_player.name]
+                        first = last_player
                 else:
-                    self.log.debug('%s called %s and was wrong!' % (player.name, bid))
+                    if debug:
+                        self.log.debug('%s called %s and was wrong!', player.name, bid)
                     # this player got it wrong and loses a die!
-                    player_die_count[player.name] -= 1
-                    make_player_first(self.players, player)
-
-            self.log.info("GAME FINISHED %s" % game_stats)
+                    losers = [player.name]
+                    first = player
+                if table is not None:
+                    for loser in losers:
+                        table.lose(loser)
+                    table.make_first(first.name)
+                else:
+                    for loser in losers:
+                        player_die_count[loser] -= 1
+                    make_player_first(self.players, first)
+
+                if events:
+                    events.publish('challenge', game, player.name, bid=bid, last_bid=lastbid,
+                                   last_player=last_player.name if last_player else None, outcome=outcome)
+                    events.publish('reveal', game, die=dict((p.name, list(player_die[p.name])) for p in active_players),
+                                   losers=losers)
+                    events.flush()
+
+            if table is not None:
+                # back into Match's list, in the same order make_player_first would have left it
+                self.players[:] = table.seated()
+            self.log.info("GAME FINISHED %s", game_stats)
+            for player in self.players:
+                merge_stats(player_stats[player.name], game_player_stats[player.name])
+            if self.keep_results:
+                self.results.append({'winner': active_players[0].name, 'stats': game_player_stats})
 
             if self.rules.bestof:
                 bestof_done = False
                 for player in self.players:
                     if player_stats[player.name]['wins'] >= self.bestof_target:
-                        self.log.warn("MATCH FINISHED - %s WON BEST OF %s WITH %s of %s GAMES" % (
-                            player.name,
-                            self.games,
-                            player_stats[player.name]['wins'],
-                            player_stats[player.name]['wins'] + player_stats[player.name]['losses'],
-                        ))
+                        self.log.warn("MATCH FINISHED - %s WON BEST OF %s WITH %s of %s GAMES",
+                                      player.name,
+                                      self.games,
+                                      player_stats[player.name]['wins'],
+                                      player_stats[player.name]['wins'] + player_stats[player.name]['losses'],
+                                      )
                         bestof_done = True
                         break
                 if bestof_done:
                     break
 
+        if self.gamelog:
+            self.events.unsubscribe(gamelog)
+            gamelog.close()
+
+        if metrics is not None:
+            metrics.finish()
+
         for player in self.players:
-            self.log.warn("%s %s" % (player.name, player_stats[player.name]))
+            self.log.warn("%s %s", player.name, player_stats[player.name])
         self.in_progress = False
+        self.player_stats = player_stats
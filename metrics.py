@@ -0,0 +1,212 @@
+"""
+instrumentation for a Match - where the time goes, bot by bot, and how long the rounds and games run
+
+    metrics = MatchMetrics(sinks=[LoggingSink(), JsonLinesSink('metrics.jsonl')])
+    match = Match(rules, games=100, instrument=metrics)
+    ...
+    match.run()
+    metrics.report()
+
+a match without an instrument only pays for an `is not None` check at each place it would measure
+"""
+import bisect
+import json
+import logging
+import timeit
+
+# the clock the match measures with
+clock = timeit.default_timer
+
+# latency buckets, 1us doubling up to about a minute - each holds the times up to and including its bound
+BUCKETS = [1e-6 * 2 ** i for i in range(27)]
+
+
+class Histogram(object):
+    """
+    counts of latencies in BUCKETS, and their total and maximum
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """
+        the upper bound of the bucket holding the p'th percentile, or the maximum if that is smaller
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+            # [upper bound, count] for each bucket used, None for the overflow
+            'buckets': [[BUCKETS[i] if i < len(BUCKETS) else None, count]
+                        for i, count in enumerate(self.counts) if count],
+        }
+
+
+def distribution(counts):
+    """
+    summary of a dict of value -> how often it happened
+    """
+    total = sum(counts.values())
+    return {
+        'count': total,
+        'mean': sum(value * n for value, n in counts.items()) / float(total) if total else 0.0,
+        'max': max(counts) if counts else 0,
+        # json keys have to be strings
+        'counts': dict(('%s' % value, n) for value, n in sorted(counts.items())),
+    }
+
+
+class MatchMetrics(object):
+    """
+    collects a match's metrics as it is played, and hands the report to its sinks when the match finishes
+
+    the same MatchMetrics can follow several matches in turn, each report covers everything so far
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.latency = {}
+        self.derps = {}
+        self.timers = {}
+        self.bids_per_round = {}
+        self.rounds_per_game = {}
+        self.rounds = 0
+        self.matches = 0
+        self.elapsed = 0.0
+        self.started = None
+        self.seed = None
+
+    def start(self, match):
+        self.started = clock()
+        self.seed = match.rng.seed
+        for player in match.players:
+            self.latency.setdefault(player.name, Histogram())
+            self.derps.setdefault(player.name, 0)
+
+    def decision(self, name, seconds):
+        """
+        a get_bid call - for a deferred player, the wait for their bid
+        """
+        self.latency[name].add(seconds)
+
+    def derp(self, name):
+        self.derps[name] += 1
+
+    def timed(self, name, seconds):
+        """
+        time spent in part of the GM's own work, e.g. 'evaluate' or 'dice'
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+
+    def round_end(self, bids):
+        self.bids_per_round[bids] = self.bids_per_round.get(bids, 0) + 1
+        self.rounds += 1
+
+    def game_end(self):
+        self.rounds_per_game[self.rounds] = self.rounds_per_game.get(self.rounds, 0) + 1
+        self.rounds = 0
+
+    def finish(self):
+        self.matches += 1
+        self.elapsed += clock() - self.started
+        report = self.report()
+        for sink in self.sinks:
+            sink.emit(report)
+        return report
+
+    def report(self):
+        """
+        :return: everything measured so far, as a dict of plain types ready for json
+        """
+        return {
+            'matches': self.matches,
+            'seed': self.seed,
+            'elapsed': self.elapsed,
+            'players': dict((name, {'latency': histogram.summary(), 'derps': self.derps[name]})
+                            for name, histogram in self.latency.items()),
+            'timers': dict((name, {'calls': calls, 'total': total}) for name, (calls, total) in self.timers.items()),
+            'bids_per_round': distribution(self.bids_per_round),
+            'rounds_per_game': distribution(self.rounds_per_game),
+        }
+
+
+class MetricsSink(object):
+    """
+    somewhere for reports to go - subclasses implement emit
+    """
+
+    def emit(self, report):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LoggingSink(MetricsSink):
+    """
+    a line per player and per timer in the log
+    """
+
+    def __init__(self, logger='METRICS', level=logging.INFO):
+        self.log = logging.getLogger(logger)
+        self.level = level
+
+    def emit(self, report):
+        log = self.log
+        if not log.isEnabledFor(self.level):
+            return
+        for name, player in sorted(report['players'].items()):
+            latency = player['latency']
+            log.log(self.level, '%s: %s decisions, %.3fs, p50 %.6fs p99 %.6fs max %.6fs, %s derps', name,
+                    latency['count'], latency['total'], latency['p50'], latency['p99'], latency['max'],
+                    player['derps'])
+        for name, timer in sorted(report['timers'].items()):
+            log.log(self.level, '%s: %s calls, %.3fs', name, timer['calls'], timer['total'])
+        log.log(self.level, '%.1f bids per round, %.1f rounds per game, %.3fs in all',
+                report['bids_per_round']['mean'], report['rounds_per_game']['mean'], report['elapsed'])
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    appends each report to a file as a line of json
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def emit(self, report):
+        self.file.write(json.dumps(report, sort_keys=True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -1,5 +1,139 @@
-from bayes import BayesBot
-from randombot import RandomBot
-from human import Human
-from mathsbot import MathsBot
-from minmax import MinMaxBot
+"""
+the players, imported when first asked for - players.MathsBot, or players.get('maths') - so a worker that plays
+one bot doesn't pay to import them all
+
+third party players are found by get() too, from
+    the 'liarsdice.players' entry point group
+        e.g. entry_points={'liarsdice.players': ['mybot = mypackage.mybot:MyBot']} in a setup.py
+    .py files in the directories listed in $LIARSDICE_PLAYER_PATH - get('mybot') loads mybot.py and takes its
+        PLAYER attribute, or else the Player subclass it defines
+"""
+import imp
+import importlib
+import os
+import sys
+import types
+
+ENTRY_POINT_GROUP = 'liarsdice.players'
+PLUGIN_PATH = 'LIARSDICE_PLAYER_PATH'
+
+# class name -> module in this package
+BUILTIN = {
+    'BayesBot': 'bayes',
+    'CFRBot': 'cfrbot',
+    'Human': 'human',
+    'MathsBot': 'mathsbot',
+    'MinMaxBot': 'minmax',
+    'MonteCarloBot': 'montecarlo',
+    'RandomBot': 'randombot',
+    'Remote': 'remote',
+}
+
+# lowercase name -> player class, for get
+registry = {}
+
+
+def normalise(name):
+    return name.lower().replace('-', '').replace('_', '')
+
+
+def builtin_names():
+    """
+    the names get knows the builtin players by - 'mathsbot', 'maths' and the class name all find MathsBot
+    """
+    names = {}
+    for class_name, module in BUILTIN.items():
+        key = normalise(class_name)
+        names[key] = names[module] = class_name
+        if key.endswith('bot'):
+            names[key[:-3]] = class_name
+    return names
+
+
+ALIASES = builtin_names()
+
+
+def load_builtin(class_name):
+    module = importlib.import_module('%s.%s' % (__name__, BUILTIN[class_name]))
+    return getattr(module, class_name)
+
+
+def register(name, player_class):
+    """
+    makes player_class available through get(name)
+    """
+    registry[normalise(name)] = player_class
+
+
+def from_entry_points(name):
+    try:
+        import pkg_resources
+    except ImportError:
+        return None
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+        if normalise(entry_point.name) == name:
+            return entry_point.load()
+    return None
+
+
+def from_plugin_path(name):
+    from .player import Player
+    for directory in filter(None, os.environ.get(PLUGIN_PATH, '').split(os.pathsep)):
+        for filename in os.listdir(directory):
+            module_name, extension = os.path.splitext(filename)
+            if extension != '.py' or normalise(module_name) != name:
+                continue
+            module = imp.load_source('liarsdice_plugin_%s' % module_name, os.path.join(directory, filename))
+            player_class = getattr(module, 'PLAYER', None)
+            if player_class is None:
+                defined = [value for value in vars(module).values() if isinstance(value, type) and
+                           issubclass(value, Player) and value.__module__ == module.__name__]
+                if len(defined) != 1:
+                    raise ImportError('%s should define one Player subclass, or set PLAYER' % filename)
+                player_class = defined[0]
+            return player_class
+    return None
+
+
+def get(name):
+    """
+    the player class called name - a registered or builtin player, then an entry point, then a plugin
+    :raises KeyError: if there is no such player
+    """
+    key = normalise(name)
+    if key in registry:
+        return registry[key]
+    if key in ALIASES:
+        player_class = load_builtin(ALIASES[key])
+    else:
+        # only look further afield for names we don't know, as it is slow
+        player_class = from_entry_points(key) or from_plugin_path(key)
+        if player_class is None:
+            raise KeyError('no player called %s' % name)
+    registry[key] = player_class
+    return player_class
+
+
+class PlayersModule(types.ModuleType):
+    """
+    this package, with the builtin players loaded on first use rather than on import
+    """
+
+    def __getattr__(self, name):
+        if name in BUILTIN:
+            player_class = load_builtin(name)
+            setattr(self, name, player_class)
+            return player_class
+        raise AttributeError("'module' object has no attribute '%s'" % name)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(BUILTIN))
+
+
+__all__ = sorted(BUILTIN) + ['get', 'register']
+
+module = PlayersModule(__name__, __doc__)
+module.__dict__.update(sys.modules[__name__].__dict__)
+# the original module has to live on, python 2 clears a module's globals when it goes
+module.original = sys.modules[__name__]
+sys.modules[__name__] = module
@@ -1,64 +1,114 @@
 from .mathsbot import MathsBot
-from operator import mul
-from fractions import Fraction
+from cache import LRUCache
+from probability import probability_exact, probability_gte
+from probability import probability_exact_given_cup
+
+# decisions are the same for every BayesBot in the same state, so they share one cache
+DECISIONS = LRUCache(maxsize=200000, name='bayes.decisions')
 
 
 class BayesBot(MathsBot):
+    supports_batch = False
+
+    def new_round(self, diestate, player_die_count):
+        super(BayesBot, self).new_round(diestate, player_die_count)
+        self.my_faces = tuple(self.faces)
+
     def get_bid(self, lastbid, *pargs, **kwargs):
-        # this bot understands its own hand and uses this to influence starting bids, 'liar' calls and bids
-
-        # iterate every possible call
-        calls = []
-        for i in range(lastbid.value, self.rules.die_sides + 1):
-            # for every value, find a good quantity to bid, given what we know (e.g. if we have 5 sixes, it may be worth betting 7 sixes):
-            # P(A|B) = P(B|A)*P(A) / P(B)
-            # WHERE A='at least 3 5s in total' and B='my cup has two 5s'
-            # P(B|A) or 'what is the chance I have two 5s when there are at least 3 5s in total'
-
-            # P(A) is get_unbiased_probability_gte(total, 3)
-            # P(B) is get_unbiased_probability_exact(mycup, 2)
-            # although these numbers can be doubled if wilds are in play
-            pass
-
-        if lastbid is None:
-            # always start with the largest safe estimate (although this may give our game away)
-            q = max(self.max_freq, int(self.expected_qty))
-            v = self.max_value
-        else:
-            if lastbid.quantity > self.die_total or lastbid.value > self.rules.die_sides or lastbid.quantity > max(
-                    self.expected_qty, self.max_freq):
-                return self.Bid('liar')
+        # this bot understands its own hand, and scores every call it could make by the chance it is right:
+        # P(A|B) - 'the chance there are at least 3 5s in total, given my cup has two 5s'
+        # which is just the chance that the die I can't see make up the difference
+        # (see get_probability_mine_given_total for the same thing the long way round, with Bayes' theorem)
+        value_lock = bool(kwargs.get('value_lock'))
+        hidden_die = self.die_total - len(self.diestate)
+        last = None if lastbid is None else (lastbid.quantity, lastbid.value)
+        rules = (self.rules.die_sides, self.rules.wilds, self.rules.wilds_lock, self.rules.exact)
+        key = (self.my_faces, hidden_die, last, value_lock, rules, self.settings.get('bid_threshold', 0.5))
+
+        decision = DECISIONS.get(key)
+        if decision is None:
+            decision = DECISIONS[key] = self.decide(lastbid, hidden_die, value_lock)
+        return self.Bid(*decision)
+
+    def decide(self, lastbid, hidden_die, value_lock):
+        """
+        :return: the (call, quantity, value) most likely to be right
+        """
+        sides = self.rules.die_sides
+        wilds = self.rules.wilds
+        candidates = []
+
+        if lastbid is not None:
+            if 1 <= lastbid.value <= sides:
+                p_true = self.probability_of(lastbid.quantity, lastbid.value)
             else:
-                q = lastbid.quantity + 1
-                v = lastbid.value
-        return self.Bid('bid', q, v)
+                p_true = 0.0
+            candidates.append((1 - p_true, 0, ('liar', 0, 0)))
+            if self.rules.exact and 1 <= lastbid.value <= sides:
+                p_exact = probability_exact_given_cup(lastbid.quantity, lastbid.value, self.faces, hidden_die,
+                                                      sides, wilds)
+                candidates.append((p_exact, 0, ('exact', 0, 0)))
+
+        # for each value, bid the largest quantity that is still likely enough, or the smallest we can
+        threshold = self.settings.get('bid_threshold', 0.5)
+        for v in range(1, sides + 1):
+            q_range = self.quantity_range(lastbid, v, value_lock)
+            if q_range is None:
+                continue
+            q_min, q_max = q_range
+            q = q_min
+            for bigger in range(q_min + 1, min(q_max, self.die_total) + 1):
+                if self.probability_of(bigger, v) < threshold:
+                    break
+                q = bigger
+            # raises win ties with calls, as they keep the round going
+            candidates.append((self.probability_of(q, v), 1, ('bid', q, v)))
+
+        best = max(candidates)
+        return best[2]
+
+    def quantity_range(self, lastbid, value, value_lock):
+        """
+        the (smallest, largest) quantity we could bid on value after lastbid, or None if we can't bid on value
+        """
+        q_range = self.legal_moves.bounds(lastbid, value_lock)[value]
+        if q_range is None:
+            return None
+        return max(q_range[0], 1), q_range[1]
 
 
 def nCk(n, k):
-    return int(reduce(mul, (Fraction(n - i, i + 1) for i in range(k)), 1))
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in range(min(k, n - k)):
+        result = result * (n - i) // (i + 1)
+    return result
 
 
 def get_unbiased_probability_exact(total_die, die_sides, quantity):
     """
     the probability that in total_die, there are exactly quantity die (of any given face)
     """
-    die_sides = float(die_sides)
-    return nCk(total_die, quantity) * ((1 / die_sides) ** quantity) * (
-    ((die_sides - 1) / die_sides) ** (total_die - quantity))
+    return probability_exact(quantity, total_die, die_sides)
 
 
 def get_unbiased_probability_gte(total_die, die_sides, quantity):
     """
     the probability that in total_die, there are at least quantity die (of any given face)
     """
-    probability = 0
-    for q in range(quantity, total_die + 1):
-        probability += get_unbiased_probability_exact(total_die, die_sides, q)
-    return probability
+    return probability_gte(quantity, total_die, die_sides)
 
 
-def get_probability_mine_given_total(total_die, die_sides, my_quantity, my_total):
+def get_probability_mine_given_total(total_die, die_sides, my_quantity, my_total, quantity):
     """
     # P(B|A) or 'what is the chance I have two 5s when there are at least 3 5s in total'
+    P(B|A) = P(A|B) * P(B) / P(A)
+    WHERE A='at least quantity of a face in total_die' and B='my_total die have exactly my_quantity of that face'
     """
-    pass
+    p_a = get_unbiased_probability_gte(total_die, die_sides, quantity)
+    if not p_a:
+        return 0.0
+    p_b = get_unbiased_probability_exact(my_total, die_sides, my_quantity)
+    p_a_given_b = get_unbiased_probability_gte(total_die - my_total, die_sides, quantity - my_quantity)
+    return p_a_given_b * p_b / p_a
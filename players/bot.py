@@ -1,7 +1,13 @@
 from .player import Player
+from helpers import get_faces
+from legal import LegalMoves
 
 
 class Bot(Player):
+    # bots that can play many independent games at once (see batch.BatchMatch) set this, and answer
+    # get_bid_batch as batch.ScalarBatch does - the rest are played through a ScalarBatch
+    supports_batch = False
+
     def idiocy_check(self, lastbid):
         """
         if your opponent called an impossible qv pair, call them
@@ -12,13 +18,35 @@ class Bot(Player):
 
     def new_round(self, diestate, player_die_count):
         self.diestate = diestate
+        # the GM hands us a helpers.Cup with the histogram already counted
+        self.faces = getattr(diestate, 'faces', None) or get_faces(diestate, self.rules.die_sides)
 
         # first step in being a bot is to keep track of everyone's die count
+        # the GM shares a helpers.RoundState with the total already worked out, anyone else may pass a dict
         self.die_counts = player_die_count
-        self.die_total = 0
-        for p, c in self.die_counts.items():
-            self.die_total += c
+        self.die_total = getattr(player_die_count, 'total', None)
+        if self.die_total is None:
+            self.die_total = sum(player_die_count.values())
 
     def new_game(self, players, rules):
         self.other_players = players
         self.rules = rules
+        if self.legal_moves is None or self.legal_moves.rules is not rules:
+            self.legal_moves = LegalMoves(rules)
+
+    def new_round_batch(self, games, dice, faces, die_counts, seats=None):
+        """
+        actions on starting a new round in many games at once, the batch equivalent of new_round
+        :param games: game ids, one per row
+        :param dice: (games, starting_die) array of this bot's die, zero padded
+        :param faces: (games, die_sides + 1) array of this bot's face counts
+        :param die_counts: (games, players) array of everyone's die count
+        :param seats: (games, players) array of player numbers in bidding order, including those who are out
+        :return:
+        """
+        self.batch_faces = faces
+        self.batch_die_counts = die_counts
+        self.batch_die_total = die_counts.sum(axis=1)
+
+    def idiocy_check_batch(self, rows, last_q, last_v):
+        return (last_q > self.batch_die_total[rows]) | (last_v > self.rules.die_sides)
@@ -0,0 +1,54 @@
+import os
+
+from .mathsbot import MathsBot
+
+try:
+    from cfr import StrategyTable
+except ImportError:
+    # the solver needs numpy
+    StrategyTable = None
+
+# path -> StrategyTable (or None if it can't be loaded), every CFRBot playing from the same file shares one
+TABLES = {}
+
+
+def load_table(path):
+    if path not in TABLES:
+        TABLES[path] = StrategyTable(path) if StrategyTable is not None and os.path.exists(path) else None
+    return TABLES[path]
+
+
+class CFRBot(MathsBot):
+    """
+    plays two player rounds from a strategy solved by cfr.py, and like a MathsBot everywhere else - more players,
+    more die than were solved, other rules, or no table at all
+
+    settings - strategy: the path of the table, cfr.npz by default
+    """
+    supports_batch = False
+
+    def new_game(self, players, rules):
+        super(CFRBot, self).new_game(players, rules)
+        table = load_table(self.settings.get('strategy', 'cfr.npz'))
+        self.table = table if table is not None and table.matches(rules) else None
+
+    def new_round(self, diestate, player_die_count):
+        super(CFRBot, self).new_round(diestate, player_die_count)
+        self.cup = tuple(sorted(diestate))
+        others = [c for name, c in player_die_count.items() if c > 0 and name != self.name]
+        self.other_die = others[0] if len(others) == 1 else None
+        # whether we opened the round, found out on our first turn
+        self.opened = None
+
+    def get_bid(self, lastbid, *pargs, **kwargs):
+        if self.opened is None:
+            self.opened = lastbid is None
+        bid = None
+        if self.table is not None and self.other_die is not None:
+            if self.opened:
+                bid = self.table.choose(len(self.cup), self.other_die, 0, self.cup, lastbid, self.random)
+            else:
+                bid = self.table.choose(self.other_die, len(self.cup), 1, self.cup, lastbid, self.random)
+        if bid is None:
+            return super(CFRBot, self).get_bid(lastbid, *pargs, **kwargs)
+        return bid
@@ -23,13 +23,20 @@ class Human(Player):
     def new_round(self, diestate, player_die_count):
         self.diestate = diestate
 
+    def legal_hint(self, lastbid, value_lock):
+        bounds = self.legal_moves.bounds(lastbid, value_lock)
+        return ", ".join('%s+ %ss' % (max(b[0], 1), v) if b[0] != b[1] else '%s %ss' % (b[0], v)
+                         for v, b in enumerate(bounds) if v and b is not None)
+
     def get_bid(self, lastbid, *pargs, **kwargs):
+        value_lock = kwargs.get('value_lock')
         while True:  # human is allowed to retry if they pass an invalid bid...
             action = self.ask(lastbid)
-            if 'liar'.startswith(action):
-                return self.Bid('liar')
-            elif 'exact'.startswith(action):
-                return self.Bid('exact')
+            if 'liar'.startswith(action) or 'exact'.startswith(action):
+                if lastbid is None:
+                    print "you can't call liar or exact on the first bid"
+                    continue
+                return self.Bid('liar' if 'liar'.startswith(action) else 'exact')
             else:
                 mybid = action.split(',', 1)
                 try:
@@ -38,4 +45,9 @@ class Human(Player):
                 except Exception, e:
                     print e
                     continue
-                return self.Bid('bid', q, v)
+                bid = self.Bid('bid', q, v)
+                # check the bid here, rather than lose a die for it
+                if self.legal_moves is not None and not self.legal_moves.is_legal(bid, lastbid, value_lock):
+                    print "that's not a legal raise, you can bid %s" % self.legal_hint(lastbid, value_lock)
+                    continue
+                return bid
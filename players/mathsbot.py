@@ -1,20 +1,33 @@
 from .bot import Bot
-from helpers import get_die_freq
+from helpers import CALL_BID, CALL_LIAR
+from helpers import lazy_import
+from probability import probability_given_cup
+
+# only the batch methods use numpy, so it isn't imported until a batch needs it
+np = lazy_import('numpy')
 
 
 class MathsBot(Bot):
+    supports_batch = True
+
     def new_round(self, diestate, player_die_count):
         super(MathsBot, self).new_round(diestate, player_die_count)
-        self.my_die_freqs = get_die_freq(self.diestate)
         max_f = 0
         max_v = 0
-        ones = 0
-        for v, f in self.my_die_freqs.items():
-            if v == 1:
-                ones = f
-            elif f > max_f or f == max_f and v > max_v:
+        ones = self.faces[1]
+        # ties go to the larger value
+        for v in range(2, len(self.faces)):
+            f = self.faces[v]
+            if f and f >= max_f:
                 max_f = f
                 max_v = v
+        if not max_v:
+            # a cup of only ones - they count for any value with wilds, so bid on the top one, or else bid on ones
+            if self.rules.wilds:
+                max_v = self.rules.die_sides
+            else:
+                max_f = ones
+                max_v = 1
         self.max_freq = max_f
         self.max_value = max_v
 
@@ -25,6 +38,13 @@ class MathsBot(Bot):
             self.safe_estimate = self.safe_estimate + ones + self.expect_in_others
             # print self.safe_estimate
 
+    def probability_of(self, quantity, value):
+        """
+        the chance that there are at least quantity die of value on the table, given my cup
+        """
+        return probability_given_cup(quantity, value, self.faces, self.die_total - len(self.diestate),
+                                     self.rules.die_sides, self.rules.wilds)
+
     def get_bid(self, lastbid, *pargs, **kwargs):
         # this bot understands its own hand and uses this to influence starting bids and 'liar' calls
 
@@ -43,3 +63,30 @@ class MathsBot(Bot):
                 q = lastbid.quantity + 1
                 v = lastbid.value
         return self.Bid('bid', q, v)
+
+    def new_round_batch(self, games, dice, faces, die_counts, seats=None):
+        super(MathsBot, self).new_round_batch(games, dice, faces, die_counts, seats)
+        sides = self.rules.die_sides
+        others = faces[:, 2:]
+        max_f = others.max(axis=1)
+        # as in new_round, ties go to the larger value, and a cup of only ones bids on the top value or on ones
+        max_v = sides - (others[:, ::-1] == max_f[:, None]).argmax(axis=1)
+        only_ones = max_f == 0
+        if self.rules.wilds:
+            self.batch_max_value = np.where(only_ones, sides, max_v)
+        else:
+            self.batch_max_value = np.where(only_ones, 1, max_v)
+            max_f = np.where(only_ones, faces[:, 1], max_f)
+
+        expect_in_others = (self.batch_die_total - faces.sum(axis=1)) // sides
+        self.batch_safe_estimate = max_f + expect_in_others
+        if self.rules.wilds:
+            self.batch_safe_estimate += faces[:, 1] + expect_in_others
+
+    def get_bid_batch(self, rows, has_last, last_q, last_v, value_lock, rng):
+        safe_estimate = self.batch_safe_estimate[rows]
+        liar = has_last & (self.idiocy_check_batch(rows, last_q, last_v) | (last_q > safe_estimate))
+        calls = np.where(liar, CALL_LIAR, CALL_BID)
+        q = np.where(has_last, last_q + 1, safe_estimate)
+        v = np.where(has_last, last_v, self.batch_max_value[rows])
+        return calls, q, v
@@ -1,21 +1,238 @@
+import time
+
 from .bot import Bot
-import random
+from cache import LRUCache
+from helpers import CALL_BID, CALL_LIAR, CALL_EXACT
+from helpers import LIAR, EXACT, VALUE_BITS, VALUE_MASK
+from helpers import lazy_import
+from probability import probability_exact_given_cup, probability_given_cup
+
+# only the batch methods use numpy, so it isn't imported until a batch needs it
+np = lazy_import('numpy')
+
+# a position is worth the same to every MinMaxBot with the same cup, so they share one table
+# (my faces, hidden die, value lock, rules, settings, last bid, my turn) -> (depth, value, bound, best move)
+TRANSPOSITIONS = LRUCache(maxsize=200000, name='minmax.transpositions')
+
+# a table value is either the value of the position, or a bound on it from an alpha-beta cutoff
+BOUND_EXACT, BOUND_LOWER, BOUND_UPPER = range(3)
+
+
+class OutOfBudget(Exception):
+    pass
 
 
 class MinMaxBot(Bot):
+    """
+    searches the bids ahead - everyone else is treated as one opponent, who makes whatever move is worst for us,
+    and the die we can't see are a chance node, worked out from their distribution given our cup whenever someone
+    calls. a position is worth the chance we win the round
+
+    the search deepens a bid at a time until it runs out of depth, nodes or time, and plays the best move of the
+    deepest search it finished, so it can be cheap for simulations or thorough for a human opponent
+
+    settings
+        max_depth - bids to look ahead, 4
+        max_nodes - positions to visit per move, 500
+        time_budget - seconds per move, no limit by default
+        raises - how many of the smallest raises to consider for each value, 2 (as well as the largest likely one)
+        liar_chance - how often to call liar at random, 0
+    """
+    supports_batch = True
+
     def get_bid(self, lastbid, *pargs, **kwargs):
-        # this bot tries to play as safe as possible
-        # and doesn't make 'liar' calls unless it has to. no understanding of its own die
-        if lastbid is None:
-            # always start with the smallest estimate to maximise safety!
-            q = 1
-            # always start with sixes to annoy people
-            v = self.rules.die_sides
-        else:
-            r = random.random()
-            if (r < self.settings.get('liar_chance', 0)) or self.idiocy_check(lastbid):
+        if lastbid is not None:
+            if self.random.random() < self.settings.get('liar_chance', 0) or self.idiocy_check(lastbid):
                 return self.Bid('liar')
+        last = None if lastbid is None else lastbid.code
+        return self.Bid.from_code(self.best_move(last, self.die_total - len(self.diestate), kwargs.get('value_lock')))
+
+    def get_bid_batch(self, rows, has_last, last_q, last_v, value_lock, rng):
+        r = rng.random_sample(len(rows))
+        liar = has_last & ((r < self.settings.get('liar_chance', 0)) | self.idiocy_check_batch(rows, last_q, last_v))
+        calls = np.where(liar, CALL_LIAR, CALL_BID)
+        q = np.zeros(len(rows), dtype=int)
+        v = np.zeros(len(rows), dtype=int)
+        # the search is by position, so each row is searched in turn, sharing TRANSPOSITIONS with every other game
+        for i in np.flatnonzero(~liar):
+            row = rows[i]
+            self.faces = self.batch_faces[row].tolist()
+            self.die_total = int(self.batch_die_total[row])
+            last = int(last_q[i]) << VALUE_BITS | int(last_v[i]) if has_last[i] else None
+            best = self.best_move(last, self.die_total - sum(self.faces), value_lock[i])
+            if best == LIAR:
+                calls[i] = CALL_LIAR
+            elif best == EXACT:
+                calls[i] = CALL_EXACT
+            else:
+                q[i], v[i] = best >> VALUE_BITS, best & VALUE_MASK
+        return calls, q, v
+
+    def best_move(self, last, hidden_die, value_lock):
+        """
+        searches from my cup (self.faces, out of self.die_total) deeper and deeper until the budget runs out
+        :param last: code of the last bid, None at the start of the round
+        :return: code of the best move of the deepest search finished
+        """
+        self.value_lock = bool(value_lock)
+        self.hidden_die = hidden_die
+        self.raises = self.settings.get('raises', 2)
+        rules = (self.rules.die_sides, self.rules.wilds, self.rules.wilds_lock, self.rules.exact)
+        self.key = (tuple(self.faces), self.hidden_die, self.value_lock, rules, self.raises)
+        self.likely = self.likely_quantities()
+        self.moves_cache = {}
+
+        self.nodes = 0
+        self.max_nodes = self.settings.get('max_nodes', 500)
+        time_budget = self.settings.get('time_budget')
+        self.deadline = time.time() + time_budget if time_budget else None
+
+        best = None
+        for depth in range(1, self.settings.get('max_depth', 4) + 1):
+            # the first search always finishes, so there is always a move
+            self.budgeted = depth > 1
+            try:
+                value, move = self.search(last, True, depth, 0.0, 1.0)
+            except OutOfBudget:
+                break
+            best = move
+        return best
+
+    def likely_quantities(self):
+        """
+        for each value, the largest quantity that is at least as likely true as not
+        """
+        likely = [0] * (self.rules.die_sides + 1)
+        for v in range(1, self.rules.die_sides + 1):
+            q = 0
+            while q < self.die_total and self.p_true((q + 1) << VALUE_BITS | v) >= 0.5:
+                q += 1
+            likely[v] = q
+        return likely
+
+    def p_true(self, code):
+        """
+        the chance that the bid with this code is true, given my cup
+        """
+        v = code & VALUE_MASK
+        if not 1 <= v <= self.rules.die_sides:
+            return 0.0
+        return probability_given_cup(code >> VALUE_BITS, v, self.faces, self.hidden_die, self.rules.die_sides,
+                                     self.rules.wilds)
+
+    def p_exact(self, code):
+        v = code & VALUE_MASK
+        if not 1 <= v <= self.rules.die_sides:
+            return 0.0
+        return probability_exact_given_cup(code >> VALUE_BITS, v, self.faces, self.hidden_die,
+                                           self.rules.die_sides, self.rules.wilds)
+
+    def call_value(self, call, last, my_turn):
+        """
+        our chance of winning if whoever's turn it is makes call on last
+        """
+        if call == LIAR:
+            p_true = self.p_true(last)
+            return 1 - p_true if my_turn else p_true
+        p_exact = self.p_exact(last)
+        return p_exact if my_turn else 1 - p_exact
+
+    def static_value(self, last, my_turn):
+        """
+        the value of a position we haven't time to search - as if whoever's turn it is makes their best call
+        """
+        value = self.call_value(LIAR, last, my_turn)
+        if self.rules.exact:
+            exact = self.call_value(EXACT, last, my_turn)
+            value = max(value, exact) if my_turn else min(value, exact)
+        return value
+
+    def moves(self, last, my_turn):
+        """
+        calls first, then the raises worth considering, best first for whoever's turn it is
+        """
+        key = (last, my_turn)
+        if key in self.moves_cache:
+            return self.moves_cache[key]
+
+        calls = []
+        if last is not None:
+            calls.append(LIAR)
+            if self.rules.exact:
+                calls.append(EXACT)
+
+        raises = []
+        bounds = self.legal_moves.bounds(None if last is None else self.Bid.from_code(last), self.value_lock)
+        for v in range(1, self.rules.die_sides + 1):
+            if bounds[v] is None:
+                continue
+            low = max(bounds[v][0], 1)
+            high = min(bounds[v][1], self.die_total)
+            quantities = set(range(low, min(high, low + self.raises - 1) + 1))
+            if low <= self.likely[v] <= high:
+                quantities.add(self.likely[v])
+            raises.extend(q << VALUE_BITS | v for q in quantities)
+        # after our raise it is their turn, so the raises they could call least profitably go first
+        raises.sort(key=lambda code: self.static_value(code, not my_turn), reverse=my_turn)
+
+        moves = self.moves_cache[key] = calls + raises
+        return moves
+
+    def search(self, last, my_turn, depth, alpha, beta):
+        """
+        alpha-beta over the bids, with calls resolved by the chance of the last bid being true
+        :param last: code of the last bid, None at the start of the round
+        :param my_turn: whether we are to move, otherwise the opponent
+        :return: (value, best move as a bid code)
+        """
+        self.nodes += 1
+        if self.budgeted and (self.nodes > self.max_nodes or
+                              (self.deadline is not None and time.time() > self.deadline)):
+            raise OutOfBudget
+
+        key = self.key + (last, my_turn)
+        entry = TRANSPOSITIONS.get(key)
+        best_first = None
+        if entry is not None:
+            entry_depth, value, bound, move = entry
+            if entry_depth >= depth and (bound == BOUND_EXACT or
+                                         (bound == BOUND_LOWER and value >= beta) or
+                                         (bound == BOUND_UPPER and value <= alpha)):
+                return value, move
+            # the best move of a shallower search is a good one to try first
+            best_first = move
+
+        moves = self.moves(last, my_turn)
+        if best_first is not None and best_first in moves:
+            moves = [best_first] + [move for move in moves if move != best_first]
+
+        start_alpha, start_beta = alpha, beta
+        best_value = None
+        best_move = None
+        for move in moves:
+            if move < 0:
+                value = self.call_value(move, last, my_turn)
+            elif depth <= 1:
+                value = self.static_value(move, not my_turn)
             else:
-                q = lastbid.quantity + 1
-                v = lastbid.value
-        return self.Bid('bid', q, v)
+                value = self.search(move, not my_turn, depth - 1, alpha, beta)[0]
+
+            if my_turn:
+                if best_value is None or value > best_value:
+                    best_value, best_move = value, move
+                alpha = max(alpha, value)
+            else:
+                if best_value is None or value < best_value:
+                    best_value, best_move = value, move
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= start_alpha:
+            bound = BOUND_UPPER
+        elif best_value >= start_beta:
+            bound = BOUND_LOWER
+        else:
+            bound = BOUND_EXACT
+        TRANSPOSITIONS[key] = (depth, best_value, bound, best_move)
+        return best_value, best_move
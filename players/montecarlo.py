@@ -0,0 +1,133 @@
+import math
+import time
+
+import numpy as np
+
+from .bot import Bot
+from helpers import count_value
+
+
+def rank(candidate):
+    # exact ties go to the higher bid, by its code rather than the Bid itself, so they're settled the same every run
+    p, is_raise, bid = candidate
+    return p, is_raise, bid.code
+
+
+class MonteCarloBot(Bot):
+    """
+    estimates its chances by simulation - rolls the die it can't see many times over, in numpy batches, and counts
+    how often each call would be right given its own cup
+
+    not every legal raise is scored - the smallest raise on a value is always the likeliest, so comparing them all
+    would only ever bid the minimum. instead each value gets one raise, the largest quantity that still came up in
+    bid_threshold of the samples, and that raise, liar and exact are scored by how often they were right. sampling
+    stops as soon as the best of them is clearly ahead of the next best, or the budget runs out, so easy decisions
+    only cost one batch
+
+    settings
+        batch - hidden cups rolled at a time, 256
+        max_samples - the most hidden cups rolled per move, 4096
+        time_budget - seconds per move, no limit by default
+        separation - how many standard errors the best action must be ahead by to stop early, 2
+        bid_threshold - how likely a raise must be to bid it over a smaller one, 0.5
+        liar_chance - how often to call liar at random, 0
+    """
+    supports_batch = False
+
+    def new_game(self, players, rules):
+        super(MonteCarloBot, self).new_game(players, rules)
+        # seeded from the player's own stream, so a seeded match stays repeatable
+        self.np_random = np.random.RandomState(self.random.getrandbits(32))
+
+    def new_round(self, diestate, player_die_count):
+        super(MonteCarloBot, self).new_round(diestate, player_die_count)
+        self.hidden_die = self.die_total - len(self.diestate)
+        sides = self.rules.die_sides
+        # what my cup adds to a bid on each value
+        self.my_counts = np.array([count_value(self.faces, v, self.rules.wilds) for v in range(sides + 1)])
+
+    def get_bid(self, lastbid, *pargs, **kwargs):
+        if lastbid is not None:
+            if self.random.random() < self.settings.get('liar_chance', 0) or self.idiocy_check(lastbid):
+                return self.Bid('liar')
+
+        value_lock = bool(kwargs.get('value_lock'))
+        batch = self.settings.get('batch', 256)
+        max_samples = self.settings.get('max_samples', 4096)
+        time_budget = self.settings.get('time_budget')
+        deadline = time.time() + time_budget if time_budget else None
+        separation = self.settings.get('separation', 2.0)
+
+        # histogram[v, c] - how many samples had c die counting towards a bid on v
+        histogram = np.zeros((self.rules.die_sides + 1, self.die_total + 2), dtype=np.int64)
+        samples = 0
+        while True:
+            self.sample(histogram, batch)
+            samples += batch
+            candidates = self.candidates(histogram, samples, lastbid, value_lock)
+            if samples >= max_samples or (deadline is not None and time.time() > deadline):
+                break
+            if len(candidates) < 2 or self.separated(candidates, samples, separation):
+                break
+
+        p, is_raise, bid = max(candidates, key=rank)
+        return bid
+
+    def sample(self, histogram, batch):
+        """
+        rolls batch hidden cups, and adds their counts for every value to histogram
+        """
+        sides = self.rules.die_sides
+        hidden = self.np_random.randint(1, sides + 1, size=(batch, self.hidden_die))
+        # faces[i, v] - how many of cup i's die show v
+        faces = (hidden[:, :, None] == np.arange(sides + 1)).sum(axis=1)
+        if self.rules.wilds:
+            faces[:, 2:] += faces[:, 1:2]
+        counts = faces + self.my_counts
+        width = histogram.shape[1]
+        for v in range(1, sides + 1):
+            histogram[v] += np.bincount(counts[:, v], minlength=width)[:width]
+
+    def candidates(self, histogram, samples, lastbid, value_lock):
+        """
+        :return: list of (estimated chance of being right, whether it is a raise, bid), raises win ties with calls
+        as they keep the round going
+        """
+        sides = self.rules.die_sides
+        # at_least[v, q] - the share of samples with q or more die counting towards v
+        at_least = histogram[:, ::-1].cumsum(axis=1)[:, ::-1] / float(samples)
+        candidates = []
+
+        if lastbid is not None and 1 <= lastbid.value <= sides:
+            q, v = lastbid.quantity, lastbid.value
+            p_true = at_least[v, max(q, 1)] if q <= self.die_total else 0.0
+            candidates.append((1 - p_true, 0, self.Bid('liar')))
+            if self.rules.exact:
+                p_exact = histogram[v, q] / float(samples) if 1 <= q <= self.die_total else 0.0
+                candidates.append((p_exact, 0, self.Bid('exact')))
+        elif lastbid is not None:
+            candidates.append((1.0, 0, self.Bid('liar')))
+
+        threshold = self.settings.get('bid_threshold', 0.5)
+        bounds = self.legal_moves.bounds(lastbid, value_lock)
+        for v in range(1, sides + 1):
+            if bounds[v] is None:
+                continue
+            low = max(bounds[v][0], 1)
+            high = min(bounds[v][1], self.die_total)
+            if low > high:
+                continue
+            q = low
+            while q < high and at_least[v, q + 1] >= threshold:
+                q += 1
+            candidates.append((at_least[v, q], 1, self.Bid('bid', q, v)))
+        return candidates
+
+    def separated(self, candidates, samples, separation):
+        """
+        whether the best candidate is ahead of the next best by more than the noise in both their estimates
+        """
+        ranked = sorted(candidates, key=rank, reverse=True)
+        best, second = ranked[0][0], ranked[1][0]
+        error = math.sqrt((best * (1 - best) + second * (1 - second)) / samples)
+        return best - second > separation * error
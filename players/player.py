@@ -1,4 +1,5 @@
 import abc
+import random
 from helpers import Bid
 
 
@@ -8,7 +9,15 @@ class Player(object):
     Bid = Bid
     name = None
     rules = None
+    # the match's legal.LegalMoves, for checking bids before making them
+    legal_moves = None
     allow_retries = False
+    # the player's own random stream, the Match replaces the global random module with a seeded one
+    random = random
+    # observers are subscribed to the match's events, and hear them through on_events at the end of each round
+    observer = False
+    # deferred players aren't asked for bids by the Match itself, Match.play yields a request for them instead
+    deferred = False
 
     def __init__(self, name, **settings):
         self.name = name
@@ -43,5 +52,13 @@ class Player(object):
         """
         pass
 
+    def on_events(self, events):
+        """
+        what happened in the round just played (see liar.EventBus), if this player is an observer
+        :param events: list of liar.GameEvent
+        :return:
+        """
+        pass
+
     def __str__(self):
         return "%s player %s" % (self.__class__.__name__, self.name)
@@ -1,29 +1,34 @@
 from .bot import Bot
-import random
+from helpers import CALL_BID, CALL_LIAR, CALL_EXACT
+from helpers import lazy_import
+
+# only the batch methods use numpy, so it isn't imported until a batch needs it
+np = lazy_import('numpy')
 
 
 class RandomBot(Bot):
+    supports_batch = True
+
     def __init__(self, *pargs, **kwargs):
         super(Bot, self).__init__(*pargs, **kwargs)
         self.allow_retries = False
-        self.settings = {}
 
     def get_bid(self, lastbid, *pargs, **kwargs):
         # this default bot behaves quite randomly, no understanding of its own die
         # it is interesting to play, but it has little hope of winning, useful for fuzz-testing the GM
         if lastbid is None:
-            q = random.randint(1, self.die_total)
-            v = random.randint(1, self.rules.die_sides)
+            q = self.random.randint(1, self.die_total)
+            v = self.random.randint(1, self.rules.die_sides)
         else:
             # randomly pick an action
-            r = random.random()
+            r = self.random.random()
             if (r < self.settings.get('liar_chance', 0)) or self.idiocy_check(lastbid):
                 return self.Bid('liar')
             elif self.rules.exact and r < 0.1:
                 return self.Bid('exact')
             else:
                 # increment either the value or the quantity
-                p = random.random()
+                p = self.random.random()
                 q = lastbid.quantity
                 v = lastbid.value
                 if v >= self.rules.die_sides or kwargs.get('value_lock'):
@@ -33,5 +38,30 @@ class RandomBot(Bot):
                 if (p > z):
                     q += 1
                 else:
-                    v = random.randint(v + 1, self.rules.die_sides)
+                    v = self.random.randint(v + 1, self.rules.die_sides)
         return self.Bid('bid', q, v)
+
+    def get_bid_batch(self, rows, has_last, last_q, last_v, value_lock, rng):
+        n = len(rows)
+        sides = self.rules.die_sides
+        die_total = self.batch_die_total[rows]
+
+        # opening bids
+        open_q = 1 + (rng.random_sample(n) * die_total).astype(int)
+        open_v = 1 + (rng.random_sample(n) * sides).astype(int)
+
+        # randomly pick an action
+        r = rng.random_sample(n)
+        liar = (r < self.settings.get('liar_chance', 0)) | self.idiocy_check_batch(rows, last_q, last_v)
+        exact = ~liar & (r < 0.1) if self.rules.exact else np.zeros(n, dtype=bool)
+
+        # increment either the value or the quantity
+        p = rng.random_sample(n)
+        z = np.where((last_v >= sides) | value_lock, 0, 0.5)
+        raise_q = p > z
+        new_v = last_v + 1 + (rng.random_sample(n) * np.maximum(sides - last_v, 1)).astype(int)
+
+        calls = np.where(has_last & liar, CALL_LIAR, np.where(has_last & exact, CALL_EXACT, CALL_BID))
+        q = np.where(has_last, np.where(raise_q, last_q + 1, last_q), open_q)
+        v = np.where(has_last, np.where(raise_q, last_v, new_v), open_v)
+        return calls, q, v
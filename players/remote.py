@@ -0,0 +1,53 @@
+from .player import Player
+
+
+def format_bid(bid):
+    """
+    a bid as it is written in the line protocol - q,v or liar or exact, and none for no bid
+    """
+    if bid is None:
+        return 'none'
+    if bid.call == 'bid':
+        return '%s,%s' % (bid.quantity, bid.value)
+    return bid.call
+
+
+class Remote(Player):
+    """
+    a player at the other end of a connection (see server.py) - it is told about the game in lines of text,
+    and the server sends its answers into the match, so waiting for it doesn't hold up anyone else
+    """
+    deferred = True
+    observer = True
+
+    def __init__(self, name, connection, **settings):
+        super(Remote, self).__init__(name, **settings)
+        self.connection = connection
+
+    # its bids come back through the server, in answer to prompt, and it can't be asked for one (see Match.run)
+    get_bid = None
+
+    def new_game(self, players, rules):
+        self.rules = rules
+        self.connection.send_line('GAME %s' % ' '.join(player.name for player in players))
+
+    def new_round(self, diestate, player_die_count):
+        self.diestate = diestate
+        self.connection.send_line('ROUND %s' % ' '.join(str(d) for d in diestate))
+        self.connection.send_line('COUNTS %s' % ' '.join('%s:%s' % item for item in sorted(player_die_count.items())))
+
+    def prompt(self, request):
+        self.connection.send_line('BID %s %d' % (format_bid(request.lastbid), request.value_lock))
+
+    def on_events(self, events):
+        for event in events:
+            if event.kind == 'bid':
+                self.connection.send_line('SAW %s %s' % (event.player, format_bid(event.data['bid'])))
+            elif event.kind == 'challenge':
+                self.connection.send_line('CHALLENGE %s %s %s' % (event.player, format_bid(event.data['bid']),
+                                                                 int(bool(event.data['outcome']))))
+            elif event.kind == 'reveal':
+                self.connection.send_line('REVEAL %s' % ' '.join(
+                    '%s:%s' % (name, ','.join(str(d) for d in die)) for name, die in sorted(event.data['die'].items())))
+            elif event.kind == 'gameend':
+                self.connection.send_line('END %s' % event.data['winner'])
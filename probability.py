@@ -0,0 +1,75 @@
+# probability tables - the chance of there being at least q die of a value, looked up rather than summed
+import math
+
+from helpers import count_value
+from cache import memoize
+
+
+def face_probability(die_sides, wilds=False):
+    """
+    the chance that one die counts towards a bid
+    wilds - the bid is on a non-one face and ones are wild, so a one counts as well
+    """
+    return (2.0 if wilds else 1.0) / die_sides
+
+
+@memoize
+def gte_table(total_die, die_sides, wilds):
+    """
+    the cumulative binomial table for total_die die
+    table[q] is the probability that at least q of them count towards a bid, for q in 0...total_die + 1
+    """
+    p = min(face_probability(die_sides, wilds), 1.0)
+    if p == 1.0:
+        pmf = [0.0] * total_die + [1.0]
+    else:
+        # in log space, as (1 - p) ** total_die, where the usual recurrence starts, is 0.0 for a table of thousands
+        # of die - only the far tails, which really are that unlikely, come out as 0.0 this way
+        log_p = math.log(p)
+        log_q = math.log1p(-p)
+        log_n = math.lgamma(total_die + 1)
+        pmf = [math.exp(log_n - math.lgamma(k + 1) - math.lgamma(total_die - k + 1) + k * log_p +
+                        (total_die - k) * log_q) for k in range(total_die + 1)]
+
+    table = [0.0] * (total_die + 2)
+    for q in range(total_die, -1, -1):
+        table[q] = table[q + 1] + pmf[q]
+    table[0] = 1.0
+    return tuple(min(t, 1.0) for t in table)
+
+
+def probability_gte(quantity, total_die, die_sides, wilds=False, value=None):
+    """
+    the probability that in total_die, there are at least quantity die of value
+    wilds - whether ones are wild, in which case they count towards any value other than one
+    """
+    if quantity <= 0:
+        return 1.0
+    if quantity > total_die:
+        return 0.0
+    return gte_table(total_die, die_sides, bool(wilds) and value != 1)[quantity]
+
+
+def probability_exact(quantity, total_die, die_sides, wilds=False, value=None):
+    """
+    the probability that in total_die, there are exactly quantity die of value
+    """
+    if quantity < 0 or quantity > total_die:
+        return 0.0
+    table = gte_table(total_die, die_sides, bool(wilds) and value != 1)
+    return table[quantity] - table[quantity + 1]
+
+
+def probability_given_cup(quantity, value, my_faces, hidden_die, die_sides, wilds=False):
+    """
+    P(at least quantity of value | my cup) - my die are known, the hidden_die belonging to everyone else are not
+    :param my_faces: histogram of my die, from get_faces
+    """
+    return probability_gte(quantity - count_value(my_faces, value, wilds), hidden_die, die_sides, wilds, value)
+
+
+def probability_exact_given_cup(quantity, value, my_faces, hidden_die, die_sides, wilds=False):
+    """
+    P(exactly quantity of value | my cup)
+    """
+    return probability_exact(quantity - count_value(my_faces, value, wilds), hidden_die, die_sides, wilds, value)
@@ -0,0 +1,105 @@
+# random streams for a match - one for the dealer's die, one for seating, and one for each player
+import imp
+import random
+
+
+def have_numpy():
+    """
+    whether numpy is installed, without paying to import it
+    """
+    try:
+        imp.find_module('numpy')
+    except ImportError:
+        return False
+    return True
+
+
+class DiceStream(object):
+    """
+    rolls die in bulk, a buffer at a time, from a seeded stream
+
+    backend - 'python' draws the buffer with random.getrandbits, 'numpy' with a numpy RandomState (faster, but
+    a different sequence for the same seed), None picks numpy when it is installed
+    """
+
+    def __init__(self, seed=None, buffer_size=4096, backend='python'):
+        if backend is None:
+            backend = 'numpy' if have_numpy() else 'python'
+        self.backend = backend
+        self.buffer_size = buffer_size
+        self.random = random.Random(seed)
+        if backend == 'numpy':
+            # numpy is slow to import, so only when it is asked for
+            import numpy as np
+            self.np_random = np.random.RandomState(self.random.getrandbits(32))
+        # die_sides -> (buffer, position of the next unused die)
+        self.buffers = {}
+
+    def roll(self, qty, sides):
+        """
+        :return: a list of qty die
+        """
+        buf, pos = self.buffers.get(sides, ([], 0))
+        if pos + qty > len(buf):
+            buf = buf[pos:] + self.fill(max(qty, self.buffer_size), sides)
+            pos = 0
+        self.buffers[sides] = (buf, pos + qty)
+        return buf[pos:pos + qty]
+
+    def roll_cups(self, sizes, sides):
+        """
+        the die for several cups at once, as one list - the same die as rolling each cup in turn with roll, so a
+        seeded match deals the same either way
+        """
+        buf, pos = self.buffers.get(sides, ([], 0))
+        start = pos
+        end = pos + sum(sizes)
+        if end > len(buf):
+            # the buffer runs out part way, so refill it where, and by as much as, rolling cup by cup would
+            for qty in sizes:
+                if pos + qty > len(buf):
+                    buf = buf[start:] + self.fill(max(qty, self.buffer_size), sides)
+                    pos -= start
+                    start = 0
+                pos += qty
+            end = pos
+        self.buffers[sides] = (buf, end)
+        return buf[start:end]
+
+    def fill(self, qty, sides):
+        if self.backend == 'numpy':
+            return self.np_random.randint(1, sides + 1, size=qty).tolist()
+
+        if sides > 256:
+            return [self.random.randint(1, sides) for i in range(qty)]
+
+        # one die per random byte, throwing away the bytes that would make some values more likely than others
+        limit = 256 - 256 % sides
+        die = []
+        while len(die) < qty:
+            # over-draw so that one pass is usually enough after rejections
+            draws = (qty - len(die)) * 256 // limit + 8
+            raw = bytearray.fromhex('%0*x' % (draws * 2, self.random.getrandbits(draws * 8)))
+            die.extend(byte % sides + 1 for byte in raw if byte < limit)
+        return die[:qty]
+
+
+class MatchRNG(object):
+    """
+    the random streams of a match, all derived from one seed - two matches with the same seed play out the same
+    """
+
+    def __init__(self, seed=None, buffer_size=4096, backend='python'):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.seed = seed
+        seeder = random.Random(seed)
+        self.dealer = random.Random(seeder.getrandbits(64))
+        self.dice = DiceStream(seeder.getrandbits(64), buffer_size, backend)
+        self.player_seed = seeder.getrandbits(64)
+
+    def player(self, index):
+        """
+        the stream for the player in seat index (order of joining), independent of every other stream
+        """
+        return random.Random(self.player_seed + index)
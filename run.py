@@ -1,5 +1,5 @@
 import players
-from liar import Match, GameRules
+from liar import Match, GameRules, setup_logging
 import logging
 
 
@@ -23,6 +23,7 @@ if __name__ == '__main__':
     #players = [players.RandomBot(str(i)) for i in range(9)] + [players.MathsBot('one_vs_all')]
 
     rules = GameRules(starting_die=5, exact=False, wilds=False, wilds_lock=False, value_lock=False, bestof=False)
+    setup_logging(logging.DEBUG)
     match = Match(rules, games=1, loglevel=logging.DEBUG)
     for player in players:
         match.addPlayer(player)
@@ -0,0 +1,168 @@
+"""
+big tables - dozens of players, dozens of die each - for stress tests and variants
+
+    python scaling.py --players 50 --die 20 --games 3 --compare
+
+Match(rules, big_table=True) plays the same games as Match, seed for seed, with the same players, events and stats.
+it only keeps the table differently, in a Table: the die counts are an array by seat, and the seating is kept as
+linked lists over the seat numbers, so moving a player to the front or taking one out is O(1), and each round's
+die are rolled in one go and counted once. so a round only costs as much as the players still in it, where a plain
+Match also goes through everyone who is out, and adds up the faces a cup at a time
+"""
+import argparse
+import logging
+import sys
+import time
+from array import array
+
+import players
+from helpers import Cup
+from helpers import RoundState
+from liar import GameRules, Match, setup_logging
+
+
+class SeatList(object):
+    """
+    seat numbers in order, as a doubly linked list in arrays - -1 is the end of the list
+    """
+
+    def __init__(self, seats):
+        self.next = array('i', range(1, seats) + [-1])
+        self.prev = array('i', [-1] + range(seats - 1))
+        self.head = 0 if seats else -1
+
+    def remove(self, seat):
+        before, after = self.prev[seat], self.next[seat]
+        if before < 0:
+            self.head = after
+        else:
+            self.next[before] = after
+        if after >= 0:
+            self.prev[after] = before
+
+    def make_first(self, seat):
+        if seat == self.head:
+            return
+        self.remove(seat)
+        self.prev[seat] = -1
+        self.next[seat] = self.head
+        self.prev[self.head] = seat
+        self.head = seat
+
+    def __iter__(self):
+        following = self.next
+        seat = self.head
+        while seat >= 0:
+            yield seat
+            seat = following[seat]
+
+
+class Table(object):
+    """
+    one game's table, for Match's big_table mode
+
+    everyone keeps their seat number for the game. the seating is two SeatLists in the same order, everyone and
+    just the players still in, and moving a player to the front of both leaves everyone else where they were, just
+    as liar.make_player_first does with Match's list
+    """
+
+    def __init__(self, seated, starting_die):
+        self.players = list(seated)
+        self.names = tuple(player.name for player in self.players)
+        # name -> seat, which is also the RoundState index, as the names stay in seat order all game
+        self.seat = dict((name, seat) for seat, name in enumerate(self.names))
+        self.counts = array('i', [starting_die] * len(self.players))
+        self.seating = SeatList(len(self.players))
+        self.active = SeatList(len(self.players))
+        self.order = []
+
+    def deal(self, stream, sides):
+        """
+        rolls a cup for everyone still in, from a randomness.DiceStream - the same die as rolling each cup in turn
+        :return: (the players still in, in bidding order, their cups, the face counts of every die on the table)
+        """
+        counts = self.counts
+        self.order = order = list(self.active)
+        sizes = [counts[seat] for seat in order]
+        roll = stream.roll_cups(sizes, sides)
+        cups = []
+        position = 0
+        for size in sizes:
+            die = roll[position:position + size]
+            position += size
+            cup_faces = [0] * (sides + 1)
+            for value in die:
+                cup_faces[value] += 1
+            cups.append(Cup(die, tuple(cup_faces)))
+        # the table's face counts in one go, rather than adding up the cups one at a time
+        faces = [sum(column) for column in zip(*[cup.faces for cup in cups])]
+        return [self.players[seat] for seat in order], cups, faces
+
+    def round_state(self, rules):
+        """
+        the RoundState for the round last dealt, with everyone in seat order
+        """
+        names = self.names
+        return RoundState(names, self.counts, rules, [names[seat] for seat in self.order], self.seat)
+
+    def lose(self, name):
+        """
+        takes a die from name, and takes them out of the bidding if it was their last
+        """
+        seat = self.seat[name]
+        self.counts[seat] -= 1
+        if not self.counts[seat]:
+            self.active.remove(seat)
+
+    def make_first(self, name):
+        seat = self.seat[name]
+        self.seating.make_first(seat)
+        if self.counts[seat]:
+            self.active.make_first(seat)
+
+    def seated(self):
+        """
+        everyone, in the order Match would have them in its list
+        """
+        return [self.players[seat] for seat in self.seating]
+
+
+def round_cost(player_class, seats, starting_die, games=1, seed=0, big_table=False):
+    """
+    plays games between seats players of player_class, with starting_die each
+    :return: (seconds per round, rounds played)
+    """
+    match = Match(GameRules(starting_die=starting_die), games=games, loglevel=logging.ERROR, seed=seed,
+                  big_table=big_table)
+    for seat in range(seats):
+        match.addPlayer(player_class('%s%s' % (player_class.__name__, seat)))
+    start = time.time()
+    stats = match.run()
+    elapsed = time.time() - start
+    # every round ends with one call, right or wrong
+    rounds = sum(s[True] + s[False] for s in stats.values())
+    return elapsed / rounds, rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='play liar\'s dice at a big table')
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--die', type=int, default=20, help='die each player starts with')
+    parser.add_argument('--bot', default='MathsBot', help='player for every seat (see players.get)')
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', action='store_true', help='time a plain Match on the same table too')
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    player_class = players.get(args.bot)
+    modes = [True, False] if args.compare else [True]
+    for big_table in modes:
+        # the same seed plays the same games either way, so the rounds are the same too
+        per_round, rounds = round_cost(player_class, args.players, args.die, args.games, args.seed, big_table)
+        print '%-16s %s rounds, %.1fus per round' % ('big_table' if big_table else 'Match', rounds, per_round * 1e6)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
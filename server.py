@@ -0,0 +1,519 @@
+"""
+a game server - hosts many tables at once in one process, for remote players talking a line protocol over TCP
+
+    python server.py --port 4444 --remote 2 --bots MathsBot          # tables of two remote players and a MathsBot
+    python server.py --connect localhost:4444                        # play at a table from the terminal
+    python server.py --load 300                                      # load test, 300 tables on one core
+
+the server sends (one per line)
+    WELCOME name                  your name for the match
+    GAME name name ...            a new game, in seating order
+    ROUND d d d ...               your die for this round
+    COUNTS name:n name:n ...      how many die everyone has
+    BID last lock                 your turn - the last bid (q,v or none) and whether the value is locked (1 or 0)
+    INVALID reason                that wasn't a legal bid, try again
+    TIMEOUT                       too slow, that counts as an invalid bid (a derp)
+    SAW name bid                  what everyone bid, after each round
+    CHALLENGE name call outcome   who ended the round, with what, and whether they were right
+    REVEAL name:d,d name:d,d ...  everyone's die
+    END winner                    the game is over
+    BYE wins losses               the match is over
+
+and the client answers BID with q,v or liar or exact
+
+there is no asyncio in python 2, so the tables are driven by one poll loop - each Match is run through Match.play,
+which hands back a BidRequest whenever it needs a remote player's bid, and carries on when the bid arrives
+"""
+import argparse
+import errno
+import heapq
+import itertools
+import logging
+import multiprocessing
+import random
+import resource
+import select
+import socket
+import sys
+import time
+
+import players
+from helpers import Bid
+from helpers import INVALID
+from helpers import InvalidBid
+from legal import LegalMoves
+from liar import GameRules, Match, get_logger, setup_logging
+from players.remote import Remote, format_bid
+
+
+MAX_LINE = 1024
+READ_SIZE = 4096
+
+
+def parse_bid(line):
+    """
+    :return: the Bid for a line from a client, or None if it can't be read
+    :raises InvalidBid: for a bid that reads but can't be a bid at all
+    """
+    line = line.strip().lower()
+    if line in ('liar', 'exact'):
+        return Bid(line)
+    try:
+        q, v = line.split(',')
+        q, v = int(q), int(v)
+    except ValueError:
+        return None
+    if q < 1:
+        raise InvalidBid('quantity must be at least 1')
+    if not 0 <= v < 256:
+        return None
+    return Bid('bid', q, v)
+
+
+def parse_lastbid(text):
+    return None if text == 'none' else parse_bid(text)
+
+
+class Connection(object):
+    """
+    a non-blocking socket, split into lines on the way in and buffered on the way out
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.inbuf = b''
+        self.outbuf = bytearray()
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send_line(self, line):
+        if not self.closed:
+            self.outbuf += line.encode('utf-8') + b'\n'
+
+    def read_lines(self):
+        """
+        :return: the complete lines received so far - the connection is closed if the other end has gone
+        """
+        try:
+            data = self.sock.recv(READ_SIZE)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            data = b''
+        if not data:
+            self.close()
+            return []
+        self.inbuf += data
+        lines = self.inbuf.split(b'\n')
+        self.inbuf = lines.pop()
+        if len(self.inbuf) > MAX_LINE:
+            self.close()
+        return [line.decode('utf-8', 'replace').strip() for line in lines]
+
+    def write(self):
+        try:
+            sent = self.sock.send(self.outbuf)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self.close()
+            return
+        del self.outbuf[:sent]
+
+    def flush(self):
+        """
+        write whatever is left, waiting for it if need be
+        """
+        if self.closed or not self.outbuf:
+            return
+        try:
+            self.sock.setblocking(True)
+            self.sock.sendall(self.outbuf)
+        except socket.error:
+            pass
+        self.outbuf = bytearray()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sock.close()
+
+
+class Table(object):
+    """
+    one match at the server, waiting on at most one remote player at a time
+    """
+
+    def __init__(self, server, number, remotes, bots):
+        self.server = server
+        self.number = number
+        self.match = Match(server.rules, games=server.games, loglevel=logging.ERROR)
+        for player in remotes + bots:
+            self.match.addPlayer(player)
+        self.remotes = remotes
+        self.play = self.match.play()
+        self.request = None
+        # bumped on every request, so a timeout for a move that has already been made is ignored
+        self.move = 0
+        self.finished = False
+
+    def advance(self, bid=None):
+        """
+        send a bid into the match (none to start it), and run it up to the next remote player's turn
+        """
+        while True:
+            start = time.time()
+            try:
+                request = self.play.send(bid)
+            except StopIteration:
+                self.server.stats['busy'] += time.time() - start
+                self.finish()
+                return
+            self.server.stats['busy'] += time.time() - start
+            if not request.player.connection.closed:
+                break
+            # nobody there to ask
+            bid = Bid.from_code(INVALID)
+        self.request = request
+        self.move += 1
+        request.player.prompt(request)
+        self.server.wait(self, time.time() + self.server.move_timeout)
+
+    def answer(self, player, line):
+        request = self.request
+        if request is None or request.player is not player:
+            player.connection.send_line('INVALID not your turn')
+            return
+        try:
+            bid = parse_bid(line)
+        except InvalidBid, e:
+            player.connection.send_line('INVALID %s' % e)
+            return
+        if bid is None:
+            player.connection.send_line('INVALID expected q,v or liar or exact')
+            return
+        # check it here, so a typo doesn't lose the player a die
+        if bid.call != 'bid' and request.lastbid is None:
+            player.connection.send_line("INVALID you can't call %s on the first bid" % bid.call)
+            return
+        if bid.call == 'exact' and not self.server.rules.exact:
+            player.connection.send_line("INVALID exact isn't allowed")
+            return
+        if bid.call == 'bid' and not self.match.legal_moves.is_legal(bid, request.lastbid, request.value_lock):
+            player.connection.send_line('INVALID not a legal raise on %s' % format_bid(request.lastbid))
+            return
+        self.server.stats['moves'] += 1
+        self.request = None
+        self.advance(bid)
+
+    def timeout(self, move):
+        if self.request is None or move != self.move:
+            return
+        self.server.stats['timeouts'] += 1
+        self.request.player.connection.send_line('TIMEOUT')
+        self.request = None
+        self.advance(Bid.from_code(INVALID))
+
+    def finish(self):
+        self.finished = True
+        self.request = None
+        for player in self.remotes:
+            stats = self.match.player_stats[player.name]
+            player.connection.send_line('BYE %s %s' % (stats['wins'], stats['losses']))
+        self.server.finished(self)
+
+
+class GameServer(object):
+    """
+    seats remote players at tables as they connect - once remote_seats of them are waiting, a table starts with them
+    and a fresh set of bots from the lineup
+    """
+
+    def __init__(self, rules, lineup=(), remote_seats=1, games=1, move_timeout=30.0, host='127.0.0.1', port=4444,
+                 max_tables=None):
+        # lineup - (player class, settings dict) for each bot at every table
+        # max_tables - stop once this many tables have finished, for load tests
+        self.rules = rules
+        self.lineup = lineup
+        self.remote_seats = remote_seats
+        self.games = games
+        self.move_timeout = move_timeout
+        self.max_tables = max_tables
+        self.log = get_logger('SERVER')
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+
+        self.poll = select.poll()
+        self.poll.register(self.listener, select.POLLIN)
+        # fileno -> (connection, Remote player or None while still waiting for a table)
+        self.connections = {}
+        self.waiting = []
+        self.tables = set()
+        # heap of (deadline, move, table number, table)
+        self.deadlines = []
+        self.table_numbers = itertools.count()
+        self.player_numbers = itertools.count()
+        self.stats = {'tables': 0, 'finished': 0, 'moves': 0, 'timeouts': 0, 'busy': 0.0, 'peak_tables': 0}
+        self.running = False
+
+    def accept(self):
+        while True:
+            try:
+                sock, address = self.listener.accept()
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+                raise
+            connection = Connection(sock)
+            player = Remote('remote%s' % next(self.player_numbers), connection)
+            connection.send_line('WELCOME %s' % player.name)
+            self.connections[connection.fileno()] = (connection, player)
+            self.poll.register(connection, select.POLLIN)
+            self.waiting.append(player)
+            if len(self.waiting) >= self.remote_seats:
+                self.start_table()
+
+    def start_table(self):
+        remotes = self.waiting[:self.remote_seats]
+        del self.waiting[:self.remote_seats]
+        number = next(self.table_numbers)
+        bots = [player_class('%s%s-%s' % (player_class.__name__, number, i), **settings)
+                for i, (player_class, settings) in enumerate(self.lineup)]
+        table = Table(self, number, remotes, bots)
+        for player in remotes:
+            player.table = table
+        self.tables.add(table)
+        self.stats['tables'] += 1
+        self.stats['peak_tables'] = max(self.stats['peak_tables'], len(self.tables))
+        table.advance()
+
+    def wait(self, table, deadline):
+        heapq.heappush(self.deadlines, (deadline, table.move, table.number, table))
+
+    def finished(self, table):
+        self.tables.discard(table)
+        self.stats['finished'] += 1
+        if self.max_tables is not None and self.stats['finished'] >= self.max_tables:
+            self.running = False
+
+    def expire(self, now):
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, move, number, table = heapq.heappop(self.deadlines)
+            if not table.finished:
+                table.timeout(move)
+
+    def serve(self):
+        self.running = True
+        self.log.warn('SERVING ON %s:%s, %s REMOTE SEAT(S) PER TABLE WITH %s',
+                      self.address[0], self.address[1], self.remote_seats,
+                      [player_class.__name__ for player_class, settings in self.lineup])
+        while self.running:
+            # only ask to hear about sockets we have something to write to
+            for fileno, (connection, player) in self.connections.items():
+                self.poll.modify(connection, select.POLLIN | select.POLLOUT if connection.outbuf else select.POLLIN)
+
+            timeout = None
+            if self.deadlines:
+                timeout = max(0, (self.deadlines[0][0] - time.time()) * 1000)
+            try:
+                ready = self.poll.poll(timeout)
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fileno, flags in ready:
+                if fileno == self.listener.fileno():
+                    self.accept()
+                    continue
+                if fileno not in self.connections:
+                    continue
+                connection, player = self.connections[fileno]
+                if flags & select.POLLOUT:
+                    connection.write()
+                if flags & (select.POLLIN | select.POLLHUP | select.POLLERR):
+                    for line in connection.read_lines():
+                        table = getattr(player, 'table', None)
+                        if table is not None:
+                            table.answer(player, line)
+
+            self.expire(time.time())
+
+            # closed, and everything written that could be
+            for fileno, (connection, player) in self.connections.items():
+                table = getattr(player, 'table', None)
+                if not connection.closed and not connection.outbuf and table is not None and table.finished:
+                    connection.close()
+                if connection.closed:
+                    self.poll.unregister(fileno)
+                    del self.connections[fileno]
+                    if player in self.waiting:
+                        self.waiting.remove(player)
+                    elif table is not None and table.request is not None and table.request.player is player:
+                        table.timeout(table.move)
+        self.close()
+
+    def close(self):
+        for connection, player in self.connections.values():
+            connection.flush()
+            connection.close()
+        self.connections = {}
+        self.listener.close()
+
+
+def play_terminal(host, port):
+    """
+    a client for a person, lines from the server are printed and lines typed are sent
+    """
+    sock = socket.create_connection((host, port))
+    stream = sock.makefile('rb')
+    for line in stream:
+        line = line.strip()
+        print line
+        if line.startswith('BID') or line.startswith('INVALID'):
+            sock.sendall(raw_input('q,v liar or exact: ').strip() + '\n')
+        elif line.startswith('BYE'):
+            break
+    sock.close()
+
+
+class LoadClient(object):
+    """
+    one bot connection for the load test - bids the smallest legal raise of a random value, or calls liar
+    some of them go quiet, to show timeouts
+    """
+
+    def __init__(self, address, rules, rng, silent=False):
+        self.connection = Connection(socket.create_connection(address))
+        self.legal_moves = LegalMoves(rules)
+        self.random = rng
+        self.silent = silent
+        self.done = False
+
+    def handle(self, line):
+        if line.startswith('BID') and not self.silent:
+            _, last, lock = line.split()
+            lastbid = parse_lastbid(last)
+            raises = self.legal_moves.min_raises(lastbid, lock == '1')
+            if lastbid is not None and (not raises or self.random.random() < 0.3):
+                self.connection.send_line('liar')
+            else:
+                bid = self.random.choice(raises)
+                self.connection.send_line(format_bid(bid))
+        elif line.startswith('BYE'):
+            self.done = True
+
+
+def run_load_clients(args):
+    """
+    plays clients connections against the server, from another process
+    :return: the number of matches finished
+    """
+    address, rules, clients, silent, seed = args
+    rng = random.Random(seed)
+    poll = select.poll()
+    by_fileno = {}
+    finished = 0
+    to_connect = clients
+    while by_fileno or to_connect:
+        # connect a few at a time, so the tables that have started aren't kept waiting
+        for i in range(min(to_connect, 20)):
+            client = LoadClient(address, rules, rng, silent=rng.random() < silent)
+            by_fileno[client.connection.fileno()] = client
+            poll.register(client.connection, select.POLLIN)
+            to_connect -= 1
+        for fileno, client in by_fileno.items():
+            poll.modify(fileno, select.POLLIN | select.POLLOUT if client.connection.outbuf else select.POLLIN)
+        for fileno, flags in poll.poll(0 if to_connect else 1000):
+            client = by_fileno[fileno]
+            if flags & select.POLLOUT:
+                client.connection.write()
+            if flags & (select.POLLIN | select.POLLHUP | select.POLLERR):
+                for line in client.connection.read_lines():
+                    client.handle(line)
+            if client.connection.closed:
+                finished += client.done
+                poll.unregister(fileno)
+                del by_fileno[fileno]
+    return finished
+
+
+def load_test(tables, remote_seats=2, lineup=((players.MathsBot, {}),), games=1, move_timeout=3.0, silent=0.01,
+              port=0, seed=0):
+    """
+    hosts tables matches at once, the remote players are clients in a separate process
+    :return: dict of results
+    """
+    server = GameServer(GameRules(), lineup, remote_seats=remote_seats, games=games, move_timeout=move_timeout,
+                        port=port, max_tables=tables)
+    pool = multiprocessing.Pool(1)
+    clients = pool.apply_async(run_load_clients,
+                               ((server.address, server.rules, tables * remote_seats, silent, seed),))
+    start = time.time()
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF).ru_utime
+    server.serve()
+    elapsed = time.time() - start
+    cpu = resource.getrusage(resource.RUSAGE_SELF).ru_utime - cpu_start
+    finished_clients = clients.get()
+    pool.close()
+    pool.join()
+
+    stats = server.stats
+    return {
+        'tables': stats['finished'],
+        'peak_tables': stats['peak_tables'],
+        'clients_finished': finished_clients,
+        'moves': stats['moves'],
+        'timeouts': stats['timeouts'],
+        'seconds': elapsed,
+        'server_cpu_seconds': cpu,
+        'moves_per_sec': stats['moves'] / elapsed,
+        # time spent in the matches themselves, per remote move
+        'match_us_per_move': stats['busy'] / max(stats['moves'] + stats['timeouts'], 1) * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='liar\'s dice game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4444)
+    parser.add_argument('--remote', type=int, default=1, help='remote seats at each table')
+    parser.add_argument('--bots', nargs='*', default=['MathsBot'], help='bots at each table, by name (see players.get)')
+    parser.add_argument('--games', type=int, default=3, help='games in each match')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds for each move, after that it is a derp')
+    parser.add_argument('--connect', help='host:port of a server to play at, from the terminal')
+    parser.add_argument('--load', type=int, help='load test with this many tables')
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        play_terminal(host, int(port))
+        return 0
+
+    lineup = [(players.get(name), {}) for name in args.bots]
+    if args.load:
+        results = load_test(args.load, remote_seats=args.remote, lineup=lineup, games=args.games)
+        for key in sorted(results):
+            print '%s: %s' % (key, results[key])
+        return 0
+
+    server = GameServer(GameRules(), lineup, remote_seats=args.remote, games=args.games, move_timeout=args.timeout,
+                        host=args.host, port=args.port)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        server.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
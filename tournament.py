@@ -0,0 +1,124 @@
+# tournament runner - splits the games of a match into shards and plays them across a process pool
+import copy
+import itertools
+import math
+import os
+import random
+import logging
+import multiprocessing
+
+import cache
+from liar import Match, get_logger
+from liar import new_stats, merge_stats
+
+
+def play_shard(job):
+    """
+    plays one shard of a tournament in a fresh Match, with fresh players
+    :param job: (rules, lineup, games, seed)
+    :return: the Match's per-game results
+    """
+    rules, lineup, games, seed = job
+    # bestof is decided by the tournament across all shards, not within one
+    rules = copy.copy(rules)
+    rules.bestof = False
+
+    # each shard has its own seed, so the results don't depend on which worker plays it
+    # a shard's results are only kept until they are merged, so they are bounded by the shard size
+    match = Match(rules, games=games, loglevel=logging.ERROR, seed=seed, keep_results=True)
+    for player_class, name, settings in lineup:
+        match.addPlayer(player_class(name, **settings))
+    match.run()
+    return match.results
+
+
+class Tournament(object):
+    """
+    plays a match of many games across a pool of worker processes
+
+    the games are split into shards of shard_size, each seeded from the tournament seed,
+    so the merged results are the same whatever the number of workers
+    """
+
+    def __init__(self, rules, lineup, games=1000, workers=None, shard_size=100, seed=0, loglevel=None,
+                 cache_path=None, keep_results=False):
+        # lineup - (player class, name, settings dict) for each player, as players are built inside the workers
+        # cache_path - a file of warm caches (see cache.py) to start from, made by playing the first shard here
+        #    if it doesn't exist yet
+        # keep_results - keep every game's winner and stats in results, otherwise only the totals are kept
+        self.rules = rules
+        self.lineup = lineup
+        self.games = games
+        self.workers = workers or multiprocessing.cpu_count()
+        self.shard_size = shard_size
+        self.seed = seed
+        self.cache_path = cache_path
+        self.keep_results = keep_results
+        self.results = []
+        self.played = 0
+        self.log = get_logger('TOURNAMENT', loglevel)
+
+    def shards(self):
+        rng = random.Random(self.seed)
+        for start in range(0, self.games, self.shard_size):
+            yield self.rules, self.lineup, min(self.shard_size, self.games - start), rng.getrandbits(32)
+
+    def run(self):
+        player_count = len(self.lineup)
+        bestof_target = int(math.ceil(self.games / float(player_count)))
+
+        player_stats = {}
+        for player_class, name, settings in self.lineup:
+            player_stats[name] = new_stats()
+
+        self.log.warn('TOURNAMENT STARTS. %s GAME(S) WITH %s ACROSS %s WORKER(S), RULES %s',
+                      self.games, [name for _, name, _ in self.lineup], self.workers, self.rules)
+
+        shards = self.shards()
+        warmed = []
+        if self.cache_path:
+            if os.path.exists(self.cache_path):
+                self.log.info('loaded caches %s', cache.load(self.cache_path))
+            else:
+                warmed.append(play_shard(next(shards)))
+                cache.save(self.cache_path)
+            if self.workers > 1:
+                # the workers are forked from here, so they share what is cached so far rather than each copying it
+                cache.freeze()
+
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers)
+            shard_results = itertools.chain(warmed, pool.imap(play_shard, shards))
+        else:
+            pool = None
+            shard_results = itertools.chain(warmed, (play_shard(job) for job in shards))
+
+        self.played = 0
+        bestof_done = False
+        try:
+            # shards are merged in order, so bestof stops at the same game however the work was split
+            for results in shard_results:
+                for result in results:
+                    for name, stats in result['stats'].items():
+                        merge_stats(player_stats[name], stats)
+                    self.played += 1
+                    if self.keep_results:
+                        self.results.append(result)
+
+                    if self.rules.bestof and player_stats[result['winner']]['wins'] >= bestof_target:
+                        self.log.warn("TOURNAMENT FINISHED - %s WON BEST OF %s WITH %s of %s GAMES",
+                                      result['winner'], self.games, player_stats[result['winner']]['wins'],
+                                      self.played)
+                        bestof_done = True
+                        break
+                if bestof_done:
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        for name in sorted(player_stats):
+            self.log.warn("%s %s", name, player_stats[name])
+        self.player_stats = player_stats
+        return player_stats